@@ -0,0 +1,162 @@
+"""Rendering and conversion for asyncio programs (python 3.7 or later)
+
+A renderService renders arm configurations with imageGen started as an asyncio subprocess. At
+most concurrency imageGens run at once and the rest wait their turn. Cancelling a render kills
+its imageGen and removes its pose file. Poses are built and written, and the render cache is
+used, in executors, so a render never blocks the event loop. convertCodes() converts prosodic
+model codes in an executor, a chunk at a time:
+
+    async with aio.renderService(concurrency=4) as service:
+        returnCode = await service.render(arm, "b.png")
+    rows = await aio.convertCodes(codes)
+
+This module uses async def, so unlike the rest of amohs it can only be imported with python 3.
+"""
+import convert
+import funcs
+import render
+
+import asyncio, concurrent.futures, os
+from os import path
+from timeit import default_timer
+
+##### Error classes #####
+class aioError(Exception):
+    pass
+
+##### rendering #####
+class renderService(object):
+    """Renders arm configurations with at most concurrency imageGens running at once
+
+    Like render.renderer the base pose is read once and poses are built in memory, but every
+    render writes its own temporary pose file, since many run at once. Poses are built in
+    executor (the loop's default if None). With a renderCache, images that have been rendered
+    before are copied from the cache instead; the cache isn't thread safe, so it is only used
+    from a thread of its own. Create the service in the event loop it is used in, and close it
+    (or use it with async with) when done."""
+    def __init__(self, concurrency=4, baseHCposeFile=render.baseHCposeFile, baseHC=render.baseHC, cache=None, executor=None):
+        if concurrency < 1:
+            raise aioError("concurrency needs to be at least 1, got %s instead." % (str(concurrency)))
+        self.concurrency = concurrency
+        self.slots = asyncio.Semaphore(concurrency)
+        self.baseHCposeFile = baseHCposeFile
+        self.baseHCpose = render.loadPose(baseHCposeFile)
+        self.baseHC = baseHC
+        self.cache = cache
+        self.executor = executor
+        self.cacheExecutor = concurrent.futures.ThreadPoolExecutor(1) if cache is not None else None
+
+    def buildPose(self, hc):
+        return render.buildPose(hc, self.baseHCpose, self.baseHC)
+
+    def fetchCached(self, pose, imageOutFile):
+        """Returns the cache key for rendering pose to imageOutFile, and whether the image was copied from the cache"""
+        key = self.cache.key(pose, self.baseHCposeFile, imageOutFile)
+        return key, self.cache.fetch(key, imageOutFile)
+
+    def writePose(self, pose, imageOutFile):
+        """Writes pose to a new temporary pose file, returns its path"""
+        poseOutFilePath = render.tmpPoseFile(path.basename(imageOutFile))
+        try:
+            render.writePose(pose, poseOutFilePath)
+        except:
+            os.remove(poseOutFilePath)
+            raise
+        return poseOutFilePath
+
+    async def render(self, hc, imageOutFile):
+        """Renders the arm configuration hc to imageOutFile, returns imageGen's return code (0 for cached images)"""
+        loop = asyncio.get_running_loop()
+        pose = await loop.run_in_executor(self.executor, self.buildPose, hc)
+        if self.cache is not None:
+            key, cached = await loop.run_in_executor(self.cacheExecutor, self.fetchCached, pose, imageOutFile)
+            if cached:
+                return 0
+        async with self.slots:
+            # the pose file is written even if the render is cancelled meanwhile, so it is shielded
+            # and removed once it is written
+            written = loop.run_in_executor(self.executor, self.writePose, pose, imageOutFile)
+            try:
+                poseOutFilePath = await asyncio.shield(written)
+            except asyncio.CancelledError:
+                written.add_done_callback(removePoseFile)
+                raise
+            try:
+                returnCode = await runImageGen(poseOutFilePath, imageOutFile)
+            finally:
+                os.remove(poseOutFilePath)
+        if self.cache is not None and returnCode == 0:
+            await loop.run_in_executor(self.cacheExecutor, self.cache.store, key, imageOutFile)
+        return returnCode
+
+    async def renderMany(self, jobs, progress=None):
+        """Renders (arm configuration, image file) pairs, returns a list of (image file, return code), in order
+
+        progress(done, total, imageOutFile, returnCode) is called as every image is finished. If
+        a render fails, or renderMany is cancelled, the renders that haven't finished are cancelled."""
+        jobs = list(jobs)
+        finished = [0]
+        async def renderJob(hc, imageOutFile):
+            returnCode = await self.render(hc, imageOutFile)
+            finished[0] += 1
+            if progress is not None:
+                progress(finished[0], len(jobs), imageOutFile, returnCode)
+            return imageOutFile, returnCode
+        tasks = [asyncio.ensure_future(renderJob(hc, imageOutFile)) for hc, imageOutFile in jobs]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def close(self):
+        if self.cacheExecutor is not None:
+            self.cacheExecutor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, excType, excValue, traceback):
+        self.close()
+
+def removePoseFile(written):
+    """Removes the pose file of a cancelled render once its (shielded) writePose future is done"""
+    if not written.cancelled() and written.exception() is None:
+        os.remove(written.result())
+
+async def runImageGen(poseOutFilePath, imageOutFile):
+    """Renders the pose in poseOutFilePath to imageOutFile with an asyncio subprocess, returns imageGen's return code
+
+    If it is cancelled imageGen is killed (and waited for) before the cancellation goes on."""
+    start = default_timer()
+    process = None
+    try:
+        process = await asyncio.create_subprocess_exec(render.imageGen, render.sceneSpecFile, poseOutFilePath, imageOutFile,
+                                                       stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.STDOUT)
+        return await process.wait()
+    except BaseException:
+        if process is not None and process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await asyncio.shield(process.wait())
+        raise
+    finally:
+        # renders overlap, so imageGen is counted here rather than hooked (see funcs.instrumentation.count)
+        funcs.profiler.count("imageGen", default_timer() - start)
+
+##### conversion #####
+async def convertCodes(codes, executor=None, chunkSize=1000):
+    """Converts prosodic model codes in executor, returns a list of (code, angles, error), in order
+
+    Chunks of chunkSize codes are converted with convert.convertChunk. executor is any
+    concurrent.futures executor, the loop's default (threads) if None; with a
+    ProcessPoolExecutor the conversions don't compete with the event loop for the interpreter."""
+    loop = asyncio.get_running_loop()
+    chunks = await asyncio.gather(*[loop.run_in_executor(executor, convert.convertChunk, chunk) for chunk in funcs.chunks(codes, chunkSize)])
+    return [row for rows in chunks for row in rows]
+
+async def convertCode(code, executor=None):
+    """Converts one prosodic model code in executor, returns (angles, error), see convert.convertCode"""
+    return await asyncio.get_running_loop().run_in_executor(executor, convert.convertCode, code)
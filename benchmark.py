@@ -0,0 +1,256 @@
+"""Benchmarks of the hot paths of amohs, written to a json file so that runs can be compared
+
+Every benchmark is timed a number of calls at a time, a few times over, and the best and median
+time per call are recorded. Rendering is timed with imageGen stubbed out (only the pose is built
+and written). Run as a script:
+
+    python benchmark.py -o before.json
+    python benchmark.py -o after.json --compare before.json
+"""
+import hc
+import pm
+import letters
+import search
+import render
+
+import argparse, json, os, platform, random, subprocess, sys, tempfile, time, timeit
+import numpy as np
+from os import path
+
+##### Error classes #####
+class benchmarkError(Exception):
+    pass
+
+##### the word list #####
+# English letter frequencies (percent), so that generated words have realistic letter pairs
+letterFrequencies = {"a": 8.2, "b": 1.5, "c": 2.8, "d": 4.3, "e": 12.7, "f": 2.2, "g": 2.0, "h": 6.1, "i": 7.0,
+                     "j": 0.15, "k": 0.77, "l": 4.0, "m": 2.4, "n": 6.7, "o": 7.5, "p": 1.9, "q": 0.095, "r": 6.0,
+                     "s": 6.3, "t": 9.1, "u": 2.8, "v": 0.98, "w": 2.4, "x": 0.15, "y": 2.0, "z": 0.074}
+
+def generateWords(count=2000, seed=0):
+    """A reproducible list of pseudo words, with English letter frequencies and word lengths of 2 to 10 letters"""
+    rng = random.Random(seed)
+    alphabet = sorted(letterFrequencies)
+    cumulative = np.cumsum([letterFrequencies[ltr] for ltr in alphabet])
+    words = []
+    for i in range(count):
+        length = rng.randint(2, 10)
+        words.append("".join(alphabet[np.searchsorted(cumulative, rng.random()*cumulative[-1])] for j in range(length)))
+    return words
+
+##### benchmarks #####
+# (name, setup) pairs: setup(words) returns a function that does one call of the benchmark, or
+# that function and one that cleans up after the benchmark
+benchmarks = []
+
+def benchmark(name):
+    def register(setup):
+        benchmarks.append((name, setup))
+        return setup
+    return register
+
+def letterCodes():
+    letters.ensureLetters()
+    codes = []
+    for ltr in letters.lettersCols["letter"]:
+        try:
+            pm.pmHandshape(letters.letterCodingCols[ltr]["pmCode"]).toAMhandshape()
+        except Exception:
+            continue
+        codes.append(letters.letterCodingCols[ltr]["pmCode"])
+    return codes
+
+@benchmark("pm.pmHandshape (every letter code)")
+def parseSetup(words):
+    codes = letterCodes()
+    return lambda: [pm.pmHandshape(code) for code in codes]
+
+@benchmark("pm.parse cached (every letter code)")
+def cachedParseSetup(words):
+    codes = letterCodes()
+    return lambda: [pm.parse(code) for code in codes]
+
+@benchmark("pmHandshape.toAMhandshape (every letter code)")
+def toAMSetup(words):
+    parsed = [pm.pmHandshape(code) for code in letterCodes()]
+    return lambda: [handshape.toAMhandshape() for handshape in parsed]
+
+@benchmark("handshape.toHandconfigTarget (every letter)")
+def toHCSetup(words):
+    handshapes = [letters.letterToArm(ltr).handshape for ltr in letters.lettersCols["letter"]]
+    return lambda: [handshape.toHandconfigTarget() for handshape in handshapes]
+
+@benchmark("arm.toArmTarget (every letter)")
+def toArmSetup(words):
+    arms = [letters.letterToArm(ltr) for ltr in letters.lettersCols["letter"]]
+    return lambda: [arm.toArmTarget() for arm in arms]
+
+@benchmark("armconfiguration delta and metrics (every pair of letters)")
+def deltaSetup(words):
+    targets = [letters.letterToArm(ltr).toArmTarget() for ltr in letters.lettersCols["letter"]]
+    def run():
+        for a in targets:
+            for b in targets:
+                delta = a - b
+                delta.totalDegreesDifferent()
+                delta.weightedDegreesDifferent()
+    return run
+
+@benchmark("hc.degreesDifferentMatrix (every pair of letters)")
+def matrixSetup(words):
+    targets = [letters.letterToArm(ltr).toArmTarget() for ltr in letters.lettersCols["letter"]]
+    return lambda: hc.degreesDifferentMatrix(targets, method="weighted")
+
+@benchmark("letters.measureContour (word list)")
+def contourSetup(words):
+    return lambda: [letters.measureContour(word, "weighted") for word in words]
+
+@benchmark("letters.measureContours (word list)")
+def contoursSetup(words):
+    return lambda: letters.measureContours(words, "weighted")
+
+@benchmark("letters.editDistances (one word against the word list)")
+def editSetup(words):
+    return lambda: letters.editDistances(words[0], words, "weighted")
+
+@benchmark("search.nearestLetters (one frame)")
+def nearestSetup(words):
+    hand = letters.cachedLetterToArmTarget("b").hand
+    return lambda: search.nearestLetters(hand, 3)
+
+@benchmark("render.buildPose and writePose (one letter)")
+def poseSetup(words):
+    pose = render.loadPose(render.baseHCposeFile)
+    target = letters.letterToArm("b").toArmTarget()
+    handle, poseFile = tempfile.mkstemp(suffix=".yml")
+    os.close(handle)
+    def run():
+        render.writePose(render.buildPose(target, pose), poseFile)
+    return run, lambda: os.remove(poseFile)
+
+@benchmark("render.renderImage with imageGen stubbed (one letter)")
+def renderSetup(words):
+    target = letters.letterToArm("b").toArmTarget()
+    imageOutFile = path.join(tempfile.gettempdir(), "amohsBenchmark.png")
+    def run():
+        render.renderImage(target, imageOutFile)
+    def cleanup():
+        if path.exists(imageOutFile):
+            os.remove(imageOutFile)
+    return run, cleanup
+
+##### running #####
+class stubImageGen(object):
+    """Replaces the imageGen subprocess (and the printing of pose file names) while benchmarking"""
+    def __enter__(self):
+        self.runImageGen = render.runImageGen
+        self.stdout = sys.stdout
+        render.runImageGen = lambda poseOutFilePath, imageOutFile, devnull=None: 0
+        sys.stdout = open(os.devnull, "w")
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        render.runImageGen = self.runImageGen
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+def timeCall(function, minTime=0.2, repeats=5):
+    """Returns the number of calls timed together, and the time per call of each of repeats runs"""
+    number = 1
+    while True:
+        elapsed = timeit.Timer(function).timeit(number)
+        if elapsed >= minTime or number >= 10**6:
+            break
+        number *= 10 if elapsed < minTime/10 else 2
+    times = [elapsed/number] + [timeit.Timer(function).timeit(number)/number for i in range(repeats-1)]
+    return number, times
+
+def runBenchmarks(words=None, names=None, minTime=0.2, repeats=5, progress=None):
+    """Runs the benchmarks (those whose names contain one of names, if given), returns the results as a dictionary"""
+    if words is None:
+        words = generateWords()
+    selected = [(name, setup) for name, setup in benchmarks if not names or any(part in name for part in names)]
+    if len(selected) == 0:
+        raise benchmarkError("None of the benchmarks match %s, the benchmarks are: %s" % (", ".join(names), ", ".join(name for name, setup in benchmarks)))
+    if len(words) == 0:
+        raise benchmarkError("The word list is empty.")
+    results = {}
+    with stubImageGen():
+        for name, setup in selected:
+            run = setup(words)
+            cleanup = None
+            if isinstance(run, tuple):
+                run, cleanup = run
+            try:
+                number, times = timeCall(run, minTime, repeats)
+            finally:
+                if cleanup is not None:
+                    cleanup()
+            results[name] = {"number": number, "repeats": repeats, "best": min(times), "median": float(np.median(times))}
+            if progress is not None:
+                progress(name, results[name])
+    return {"environment": environment(), "words": len(words), "results": results}
+
+def environment():
+    """The python, numpy, platform and git commit that the benchmarks ran with"""
+    try:
+        with open(os.devnull, "w") as devnull:
+            commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=path.dirname(path.abspath(__file__)), stderr=devnull).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def compareResults(results, baseline, threshold=1.25):
+    """Returns (name, baseline best, best, ratio) for every benchmark in both, and the names of those that are more than threshold times slower"""
+    rows = []
+    regressions = []
+    for name in sorted(results["results"]):
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["best"]
+        after = results["results"][name]["best"]
+        ratio = after / before if before > 0 else float("inf")
+        rows.append((name, before, after, ratio))
+        if ratio > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+def formatTime(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "%.3g%s" % (seconds/scale, unit)
+    return "%.3gns" % (seconds/1e-9)
+
+##### command line interface #####
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of amohs.")
+    parser.add_argument("-o", "--output", default=None, help="json file to write the results to")
+    parser.add_argument("-c", "--compare", default=None, help="json file of earlier results to compare with")
+    parser.add_argument("-t", "--threshold", type=float, default=1.25, help="how many times slower than the earlier results counts as a regression (default: 1.25)")
+    parser.add_argument("-w", "--words", default=None, help="file with a word per line to use as the word list (default: 2000 generated words)")
+    parser.add_argument("-k", "--only", action="append", default=None, help="only run the benchmarks whose names contain this (can be repeated)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="the least time to run each benchmark for, per repeat (default: 0.2 seconds)")
+    parser.add_argument("--repeats", type=int, default=5, help="number of times to repeat each benchmark (default: 5)")
+    args = parser.parse_args(args)
+
+    words = None
+    if args.words is not None:
+        with open(args.words) as wordsFile:
+            words = [line.strip().lower() for line in wordsFile if line.strip()]
+    def progress(name, result):
+        sys.stderr.write("%-60s %10s per call (%s calls)\n" % (name, formatTime(result["best"]), result["number"]))
+    results = runBenchmarks(words, args.only, args.min_time, args.repeats, progress)
+    if args.output is not None:
+        with open(args.output, "w") as outFile:
+            json.dump(results, outFile, indent=2, sort_keys=True)
+    if args.compare is not None:
+        with open(args.compare) as baselineFile:
+            rows, regressions = compareResults(results, json.load(baselineFile), args.threshold)
+        for name, before, after, ratio in rows:
+            sys.stderr.write("%-60s %10s -> %10s  %.2fx%s\n" % (name, formatTime(before), formatTime(after), ratio, "  SLOWER" if name in regressions else ""))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Bulk conversion of prosodic model codes to articulatory model joint angles
+
+Codes are read as a stream (from a csv file or stdin), converted in chunks, optionally by a pool
+of worker processes, and the joint angles are written out as they are finished, so memory use
+does not grow with the size of the input. Run as a script for the command line interface:
+
+    python convert.py codes.csv --column pmCode --processes 4 -o angles.csv
+"""
+import hc
+import pm
+import funcs
+
+import argparse, csv, sys
+
+##### Error classes #####
+class conversionError(Exception):
+    pass
+
+##### converting single codes #####
+# The joint angles (or the problem) for the codes that have been converted most recently in this process
+anglesCache = funcs.conversionCache("convert.angles", maxSize=100000)
+
+def convertCode(code):
+    """Returns (angles, error) for a prosodic model code
+
+    angles are the hand configuration angles in the order of hc.handLayout, shared by every
+    conversion of code (and so read only). For codes that can't be converted angles is None and
+    error describes the problem; these are cached as well."""
+    def convert():
+        try:
+            angles = pm.parse(code).toAMhandshape().toHandconfigTarget().angles
+        except Exception as e:
+            return None, "%s: %s" % (e.__class__.__name__, e)
+        angles.flags.writeable = False
+        return angles, None
+    return anglesCache.get(code, convert)
+
+def pmCodeToAngles(code):
+    """Returns the hand configuration angles (in the order of hc.handLayout) for a prosodic model code"""
+    angles, error = convertCode(code)
+    if error is not None:
+        raise conversionError("Can't convert %s. %s" % (code, error))
+    return angles
+
+def convertChunk(codes):
+    """Converts a list of codes, returning a list of (code, angles, error) tuples"""
+    return [(code,) + convertCode(code) for code in codes]
+
+##### streaming #####
+def convertCodes(codes, processes=1, chunkSize=1000):
+    """Yields (code, angles, error) for every code in codes, in order
+
+    With more than one process the chunks are converted by a pool of worker processes. Only a
+    few chunks per process are ever waiting to be converted, so codes can be an arbitrarily long
+    stream."""
+    for rows in funcs.poolMap(convertChunk, funcs.chunks(codes, chunkSize), processes):
+        for row in rows:
+            yield row
+
+def readCodes(fileObj, column=None):
+    """Yields the codes from a csv file, from the column named column, or the first column if column is None"""
+    reader = csv.reader(fileObj)
+    if column is None:
+        for row in reader:
+            if len(row) > 0:
+                yield row[0]
+        return
+    fields = next(reader)
+    try:
+        col = fields.index(column)
+    except ValueError:
+        raise conversionError("There is no column named %s, the columns are: %s" % (column, ", ".join(fields)))
+    for row in reader:
+        if len(row) > col:
+            yield row[col]
+
+def angleFields():
+    """Returns the names of the angle columns, in the order of hc.handLayout"""
+    return [".".join(slot) for slot in hc.handLayout]
+
+# The most codes writeAngles keeps formatted cells for
+maxFormatted = 10000
+
+def writeAngles(rows, fileObj):
+    """Writes (code, angles, error) rows as csv with a header; unspecified degrees of freedom are left empty
+
+    Returns the number of rows written and the number of codes that could not be converted."""
+    writer = csv.writer(fileObj)
+    writer.writerow(["pmCode"] + angleFields() + ["error"])
+    written = 0
+    errors = 0
+    # the formatted cells for each code, codes are usually repeated many times; the cells are
+    # forgotten every maxFormatted codes so that long streams of distinct codes don't fill memory
+    formatted = {}
+    for code, angles, error in rows:
+        try:
+            cells = formatted[code]
+        except KeyError:
+            if angles is None:
+                cells = [code] + [""]*hc.handSize + [error]
+            else:
+                cells = [code] + ["" if value != value else hc.number(value) for value in angles] + [""]
+            if len(formatted) >= maxFormatted:
+                formatted.clear()
+            formatted[code] = cells
+        if angles is None:
+            errors += 1
+        writer.writerow(cells)
+        written += 1
+    return written, errors
+
+##### command line interface #####
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Convert prosodic model handshape codes to articulatory model joint angles.")
+    parser.add_argument("input", nargs="?", default="-", help="csv file with the codes (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="csv file to write the joint angles to (default: stdout)")
+    parser.add_argument("-c", "--column", default=None, help="the name of the column with the codes (default: the first column, without a header)")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="number of worker processes (default: 1)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="number of codes sent to a worker at a time (default: 1000)")
+    args = parser.parse_args(args)
+
+    inFile = sys.stdin if args.input == "-" else open(args.input, "r")
+    outFile = sys.stdout if args.output == "-" else open(args.output, "w")
+    # conversion problems are printed, so keep them out of the csv on stdout
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        rows = convertCodes(readCodes(inFile, args.column), processes=args.processes, chunkSize=args.chunk_size)
+        written, errors = writeAngles(rows, outFile)
+    finally:
+        sys.stdout = stdout
+        if inFile is not sys.stdin:
+            inFile.close()
+        if outFile is not sys.stdout:
+            outFile.close()
+    sys.stderr.write("Converted %s codes, %s could not be converted.\n" % (written-errors, errors))
+
+if __name__ == "__main__":
+    main()
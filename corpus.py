@@ -0,0 +1,251 @@
+"""Fingerspelling costs for every word of a corpus, with aggregate statistics
+
+Words are read as a stream (one word per line, or the words of a csv column), scored in chunks,
+optionally by a pool of worker processes, and the unweighted and weighted contour of every word
+(see letters.measureContour) is written out as it is finished. Statistics over the whole corpus
+are accumulated along the way: the distribution of the costs, the hardest words, and how much
+every pair of adjacent letters contributes (its frequency times its cost). Run as a script for
+the command line interface:
+
+    python corpus.py words.txt --processes 4 -o costs.csv --stats stats.json
+"""
+import hc
+import letters
+import funcs
+
+import argparse, csv, heapq, json, sys
+import numpy as np
+
+methods = ("unweighted", "weighted")
+
+##### scoring words #####
+def letterLookup():
+    """An array from every byte to its position in letters.letterIndex, -1 for bytes that aren't (single character) letters"""
+    def build():
+        lookup = -np.ones(256, dtype=np.int64)
+        for ltr, i in letters.letterIndex.items():
+            if len(ltr) == 1:
+                lookup[ord(ltr)] = i
+        return lookup
+    letters.ensureLetters()
+    return letters.letterCache.get("corpusLookup", build)
+
+def scoreChunk(words):
+    """Scores a list of words
+
+    Returns the words that can be fingerspelled (in lower case), an array with their costs for
+    each method (one column per method, see letters.measureContour), the words that can't be
+    fingerspelled and the number of times each pair of letters is adjacent, a matrix indexed by
+    letters.letterIndex. The letters of the whole chunk are looked up at once."""
+    lookup = letterLookup()
+    size = len(letters.lettersCols["letter"])
+    pairs = np.zeros(size*size, dtype=np.int64)
+    clean = [word.strip().lower() for word in words]
+    lengths = np.array([len(word) for word in clean], dtype=np.int64)
+    nonEmpty = lengths > 0
+    text = "".join(clean)
+    if not isinstance(text, bytes):
+        # python 3 strings, one byte per character (anything past latin-1 isn't a letter)
+        text = text.encode("latin-1", "replace")
+    codes = lookup[np.frombuffer(text, dtype=np.uint8)]
+    starts = np.cumsum(lengths) - lengths
+    spellable = nonEmpty.copy()
+    if nonEmpty.any():
+        spellable[nonEmpty] = np.minimum.reduceat(codes, starts[nonEmpty]) >= 0
+    spelled = [word for word, ok in zip(clean, spellable) if ok]
+    skipped = [word for word, ok in zip(words, spellable) if not ok]
+    costs = np.zeros((len(spelled), len(methods)))
+    if len(spelled) == 0:
+        return spelled, costs, skipped, pairs.reshape(size, size)
+    keep = np.repeat(spellable, lengths)
+    codes = codes[keep]
+    lengths = lengths[spellable]
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    # adjacent letters, except for the last letter of one word and the first of the next
+    within = np.ones(len(codes)-1, dtype=bool)
+    within[ends[:-1]-1] = False
+    for m, method in enumerate(methods):
+        # the same as letters.measureContours
+        cumCosts = np.concatenate(([0], np.cumsum(letters.transitionCosts(method)[codes[:-1], codes[1:]])))
+        costs[:, m] = cumCosts[np.maximum(ends-1, starts)] - cumCosts[starts]
+    pairs += np.bincount(codes[:-1][within]*size + codes[1:][within], minlength=size*size)
+    return spelled, costs, skipped, pairs.reshape(size, size)
+
+def scoreWords(words, processes=1, chunkSize=1000):
+    """Yields scoreChunk() for every chunk of words, in order, see funcs.poolMap"""
+    return funcs.poolMap(scoreChunk, funcs.chunks(words, chunkSize), processes)
+
+def readWords(fileObj, column=None):
+    """Yields the words from a file with a word per line, or from the column named column of a csv file"""
+    if column is None:
+        for line in fileObj:
+            if line.strip():
+                yield line.strip()
+        return
+    reader = csv.DictReader(fileObj)
+    if column not in (reader.fieldnames or []):
+        raise letters.specificationError("There is no column named %s, the columns are: %s" % (column, ", ".join(reader.fieldnames or [])))
+    for row in reader:
+        if row[column]:
+            yield row[column]
+
+##### statistics #####
+class costDistribution(object):
+    """The distribution of a stream of costs, in constant memory
+
+    The count, mean and variance are merged a chunk at a time, and the percentiles are read from
+    a histogram of binWidth wide bins (so each is within binWidth of a cost that was added, and
+    with many costs close to the exact percentile). The histogram only grows with the largest
+    cost, not with the number of costs."""
+    def __init__(self, binWidth=1.0):
+        self.binWidth = binWidth
+        self.count = 0
+        self.mean = 0.0
+        # the sum of the squared differences from the mean
+        self.squares = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.bins = np.zeros(0, dtype=np.int64)
+
+    def add(self, costs):
+        if len(costs) == 0:
+            return
+        count = self.count + len(costs)
+        mean = costs.mean()
+        delta = mean - self.mean
+        self.squares += ((costs - mean)**2).sum() + delta**2 * self.count * len(costs) / count
+        self.mean += delta * len(costs) / count
+        self.count = count
+        self.min = min(self.min, costs.min())
+        self.max = max(self.max, costs.max())
+        counts = np.bincount(np.maximum(costs // self.binWidth, 0).astype(np.int64))
+        if len(counts) > len(self.bins):
+            self.bins = np.concatenate((self.bins, np.zeros(len(counts) - len(self.bins), dtype=np.int64)))
+        self.bins[:len(counts)] += counts
+
+    def percentiles(self, percentiles):
+        """The costs at percentiles, spreading the costs of every bin evenly across it"""
+        cumulative = np.cumsum(self.bins)
+        # the rank of each percentile, as numpy.percentile counts them
+        ranks = np.asarray(percentiles, dtype=float) / 100 * (self.count - 1)
+        bins = np.searchsorted(cumulative, ranks, side="right")
+        before = cumulative[bins] - self.bins[bins]
+        values = (bins + (ranks - before + 0.5) / self.bins[bins]) * self.binWidth
+        return np.clip(values, self.min, self.max)
+
+    def summary(self):
+        if self.count == 0:
+            return {}
+        percentiles = (5, 25, 50, 75, 95)
+        out = {"mean": float(self.mean), "std": float(np.sqrt(self.squares / self.count)), "min": float(self.min), "max": float(self.max)}
+        for percentile, value in zip(percentiles, self.percentiles(percentiles)):
+            out["p%s" % percentile] = float(value)
+        return out
+
+class corpusStats(object):
+    """Statistics of the costs of the words of a corpus, accumulated a chunk at a time"""
+    def __init__(self, top=20):
+        self.top = top
+        self.words = 0
+        self.skipped = 0
+        self.costs = dict((method, costDistribution()) for method in methods)
+        self.hardest = dict((method, []) for method in methods)
+        self.pairs = None
+
+    def add(self, spelled, costs, skipped, pairs):
+        self.words += len(spelled)
+        self.skipped += len(skipped)
+        if self.pairs is None:
+            self.pairs = pairs.copy()
+        else:
+            self.pairs += pairs
+        for m, method in enumerate(methods):
+            self.costs[method].add(costs[:, m])
+            # the hardest words are kept in a min heap of (cost, word), only the hardest of a chunk can be among them
+            candidates = np.arange(len(spelled))
+            if len(spelled) > self.top:
+                candidates = np.argpartition(-costs[:, m], self.top-1)[:self.top]
+            for i in candidates:
+                word, cost = spelled[i], costs[i, m]
+                if len(self.hardest[method]) < self.top:
+                    heapq.heappush(self.hardest[method], (cost, word))
+                elif cost > self.hardest[method][0][0]:
+                    heapq.heapreplace(self.hardest[method], (cost, word))
+
+    def distribution(self, method):
+        return self.costs[method].summary()
+
+    def pairContributions(self, method):
+        """The (first letter, second letter, frequency, cost, frequency times cost) of the top letter pairs, biggest contribution first"""
+        if self.pairs is None:
+            return []
+        costs = letters.transitionCosts(method)
+        names = letters.lettersCols["letter"]
+        total = self.pairs * costs
+        order = np.argsort(-total, axis=None, kind="mergesort")[:self.top]
+        out = []
+        for first, second in zip(*np.unravel_index(order, total.shape)):
+            if self.pairs[first, second] > 0:
+                out.append((names[first], names[second], int(self.pairs[first, second]), hc.number(costs[first, second]), hc.number(total[first, second])))
+        return out
+
+    def summary(self):
+        """The statistics as a dictionary (that can be written as json)"""
+        out = {"words": self.words, "skipped": self.skipped}
+        for method in methods:
+            out[method] = {"distribution": self.distribution(method),
+                           "hardest": [{"word": word, "cost": hc.number(cost)} for cost, word in sorted(self.hardest[method], reverse=True)],
+                           "pairs": [{"pair": first+second, "frequency": frequency, "cost": cost, "contribution": contribution}
+                                     for first, second, frequency, cost, contribution in self.pairContributions(method)]}
+        return out
+
+def writeCosts(scored, fileObj, stats):
+    """Writes word, unweighted and weighted cost rows as csv with a header, adding every chunk to stats"""
+    writer = csv.writer(fileObj)
+    writer.writerow(("word",) + methods)
+    for spelled, costs, skipped, pairs in scored:
+        stats.add(spelled, costs, skipped, pairs)
+        for word, row in zip(spelled, costs):
+            writer.writerow([word] + [hc.number(cost) for cost in row])
+    return stats
+
+def printSummary(summary, fileObj=sys.stderr):
+    fileObj.write("Scored %s words, %s could not be fingerspelled.\n" % (summary["words"], summary["skipped"]))
+    for method in methods:
+        distribution = summary[method]["distribution"]
+        if not distribution:
+            continue
+        fileObj.write("%s: mean %.1f, median %.1f, 95th percentile %.1f, max %.1f\n" % (method, distribution["mean"], distribution["p50"], distribution["p95"], distribution["max"]))
+        fileObj.write("  hardest: %s\n" % (", ".join(item["word"] for item in summary[method]["hardest"][:10])))
+        fileObj.write("  costliest pairs: %s\n" % (", ".join(item["pair"] for item in summary[method]["pairs"][:10])))
+
+##### command line interface #####
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Measure the fingerspelling contour of every word of a corpus.")
+    parser.add_argument("input", nargs="?", default="-", help="file with a word per line, or a csv file with --column (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="csv file to write the cost of every word to (default: stdout)")
+    parser.add_argument("-c", "--column", default=None, help="the name of the column with the words, for csv input")
+    parser.add_argument("-s", "--stats", default=None, help="json file to write the statistics to")
+    parser.add_argument("-n", "--top", type=int, default=20, help="number of hardest words and costliest pairs to report (default: 20)")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="number of worker processes (default: 1)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="number of words sent to a worker at a time (default: 1000)")
+    args = parser.parse_args(args)
+
+    inFile = sys.stdin if args.input == "-" else open(args.input, "r")
+    outFile = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        stats = writeCosts(scoreWords(readWords(inFile, args.column), args.processes, args.chunk_size), outFile, corpusStats(args.top))
+    finally:
+        if inFile is not sys.stdin:
+            inFile.close()
+        if outFile is not sys.stdout:
+            outFile.close()
+    summary = stats.summary()
+    if args.stats is not None:
+        with open(args.stats, "w") as statsFile:
+            json.dump(summary, statsFile, indent=2, sort_keys=True)
+    printSummary(summary)
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,48 @@
-import csv
+import csv, functools, io, itertools, sys, threading, weakref
+import multiprocessing
+from collections import OrderedDict, deque
+from timeit import default_timer
 
-# this is not zip safe, see: http://stackoverflow.com/questions/1011337/relative-file-paths-in-python-packages
+# paths in resources_dir are not zip safe, read resources with resourceData, see: http://stackoverflow.com/questions/1011337/relative-file-paths-in-python-packages
 from os import path
 resources_dir = path.join(path.dirname(__file__), 'resources')
 
 ##### read in csvs containing information about the prosodic model notation system. #####
 def read_csv_data(path):
     """Reads CSV from given path and Return list of dict with Mapping"""
-    data = csv.reader(open(path))
+    with open(path) as fileObj:
+        return csvRows(fileObj)
+
+def csvRows(lines):
+    """Returns a dict for every row of csv lines, keyed by the column names in the first line"""
+    data = csv.reader(lines)
     # Read the column names from the first line of the file
-    fields = data.next()
+    fields = next(data)
     data_lines = []
     for row in data:
         items = dict(zip(fields, row))
         data_lines.append(items)
     return data_lines
 
+def resourceData(name):
+    """Returns the bytes of the resource name, a file in resources_dir, or the file name if it is an absolute path
+
+    Resources are read through the loader of this module, so they can be read from a zip file."""
+    if path.isabs(name):
+        with open(name, "rb") as fileObj:
+            return fileObj.read()
+    loader = globals().get("__loader__")
+    if loader is not None and hasattr(loader, "get_data"):
+        return loader.get_data(path.join(resources_dir, name))
+    with open(path.join(resources_dir, name), "rb") as fileObj:
+        return fileObj.read()
+
+def resourceCSV(data):
+    """csvRows for the bytes of a resource"""
+    if str is bytes:
+        return csvRows(io.BytesIO(data))
+    return csvRows(io.StringIO(data.decode("utf-8"), newline=""))
+
 def dictToCols(dictObject):
     outCols = {}
     for col in dictObject[0].keys():
@@ -33,3 +60,334 @@ def dictColMapper(dictObject, baseCol):
             if col != baseCol:
                 outCols[row[baseCol]][col] = row[col]
     return outCols
+
+##### tables read on first use #####
+class lazyTable(object):
+    """Stands in for the table name of module until it is read, by load(), the first time it is used
+
+    load() replaces the module's attribute with the table itself. Anything that kept the stand
+    in (e.g. from module import name) can still use it, everything is passed on to the table."""
+    def __init__(self, module, name, load):
+        self.module = module
+        self.name = name
+        self.load = load
+
+    def table(self):
+        table = vars(self.module).get(self.name)
+        if table is self:
+            self.load()
+            table = vars(self.module).get(self.name)
+            if table is self:
+                raise AttributeError("Loading %s didn't read %s." % (self.module.__name__, self.name))
+        return table
+
+    def __getattr__(self, attr):
+        if attr in ("module", "name", "load"):
+            raise AttributeError(attr)
+        return getattr(self.table(), attr)
+
+    def __getitem__(self, key):
+        return self.table()[key]
+
+    def __contains__(self, key):
+        return key in self.table()
+
+    def __iter__(self):
+        return iter(self.table())
+
+    def __len__(self):
+        return len(self.table())
+
+    def __eq__(self, other):
+        return self.table() == other
+
+    def __ne__(self, other):
+        return self.table() != other
+
+    def __repr__(self):
+        return repr(self.table())
+
+def lazyTables(module, names, load):
+    """Sets each of names of module to a lazyTable read by load()"""
+    for name in names:
+        setattr(module, name, lazyTable(module, name, load))
+
+##### caching #####
+class cacheError(Exception):
+    pass
+
+class conversionCache(object):
+    """A cache of converted values that keeps count of hits and misses
+
+    With a maxSize the cache keeps at most that many values, dropping the least recently used
+    first; without one it keeps every value. Caches with a name are included in the reports of
+    profiler."""
+    def __init__(self, name=None, maxSize=None):
+        if maxSize is not None and maxSize < 1:
+            raise cacheError("maxSize needs to be at least 1, got %s instead." % (str(maxSize)))
+        self.maxSize = maxSize
+        self.clear()
+        if name is not None:
+            profiler.registerCache(name, self)
+
+    def clear(self):
+        self.store = {} if self.maxSize is None else OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, convert):
+        """Returns the cached value for key, calling convert() to make it on a miss"""
+        try:
+            value = self.store[key]
+        except KeyError:
+            self.misses += 1
+            value = convert()
+            if self.maxSize is not None and len(self.store) >= self.maxSize:
+                self.store.popitem(last=False)
+                self.evictions += 1
+            self.store[key] = value
+        else:
+            self.hits += 1
+            if self.maxSize is not None:
+                # move key to the most recently used end (OrderedDict has no move_to_end in python 2)
+                del self.store[key]
+                self.store[key] = value
+        return value
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.store), "evictions": self.evictions}
+
+##### instrumentation #####
+class instrumentationError(Exception):
+    pass
+
+class instrumentation(object):
+    """A registry of the stages of the hot paths (parsing, conversion, rendering, ...) that counts calls and adds up the time spent in them
+
+    Modules hook the functions and methods of each stage with hook(). Nothing about them changes
+    until the registry is enabled, when each is replaced by a wrapper that does the counting (and
+    put back when it is disabled), so instrumentation costs nothing when it is off. The time of a
+    stage includes the time of the stages called from within it, and a stage called from within
+    itself (e.g. the hands subtracted inside an arm subtraction) is only counted once, in each
+    thread. Only calls in this process are counted, not those in worker processes. Stages that
+    can't be wrapped (e.g. awaited subprocesses) are counted with count(). Use as a context
+    manager:
+
+        with funcs.profiler:
+            ...
+        funcs.profiler.printReport()
+    """
+    def __init__(self):
+        self.hooks = []
+        self.originals = {}
+        self.caches = weakref.WeakValueDictionary()
+        # the calls and seconds of every stage, updated in place by the wrappers
+        self.stages = {}
+        # the stages running in each thread
+        self.running = threading.local()
+        self.enabled = False
+
+    def hook(self, stage, owner, *names):
+        """Registers the functions (or methods) named names of owner, a module or class, as part of stage"""
+        for name in names:
+            if not callable(vars(owner).get(name)):
+                raise instrumentationError("%s has no function named %s." % (owner.__name__, name))
+            self.hooks.append((stage, owner, name))
+            self.stages.setdefault(stage, [0, 0.0])
+            if self.enabled:
+                self.install(stage, owner, name)
+
+    def registerCache(self, name, cache):
+        """Includes cache, anything with a stats() method, in the reports"""
+        self.caches[name] = cache
+
+    def install(self, stage, owner, name):
+        original = vars(owner)[name]
+        self.originals[(owner, name)] = original
+        setattr(owner, name, self.wrap(stage, original))
+
+    def wrap(self, stage, function):
+        stages = self.stages
+        local = self.running
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            running = local.__dict__.setdefault("stages", set())
+            if stage in running:
+                return function(*args, **kwargs)
+            running.add(stage)
+            start = default_timer()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record = stages[stage]
+                record[0] += 1
+                record[1] += default_timer() - start
+                running.discard(stage)
+        return wrapper
+
+    def count(self, stage, seconds):
+        """Adds a call of stage that took seconds, if the registry is enabled"""
+        if self.enabled:
+            record = self.stages.setdefault(stage, [0, 0.0])
+            record[0] += 1
+            record[1] += seconds
+
+    def enable(self):
+        if self.enabled:
+            return
+        for stage, owner, name in self.hooks:
+            self.install(stage, owner, name)
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        for stage, owner, name in self.hooks:
+            setattr(owner, name, self.originals.pop((owner, name)))
+        self.enabled = False
+
+    def reset(self):
+        """Sets the counts and times of every stage back to zero"""
+        for record in self.stages.values():
+            record[0] = 0
+            record[1] = 0.0
+
+    def report(self):
+        """The calls and seconds of every stage that has been called, and the stats() of every cache, as a dictionary"""
+        stages = dict((stage, {"calls": record[0], "seconds": record[1]}) for stage, record in self.stages.items() if record[0] > 0)
+        caches = dict((name, cache.stats()) for name, cache in self.caches.items())
+        return {"stages": stages, "caches": caches}
+
+    def printReport(self, fileObj=sys.stderr):
+        report = self.report()
+        for stage, record in sorted(report["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            fileObj.write("%-20s %10d calls %12.6f seconds\n" % (stage, record["calls"], record["seconds"]))
+        for name, stats in sorted(report["caches"].items()):
+            fileObj.write("%-20s %s\n" % (name, ", ".join("%s %s" % (key, value) for key, value in sorted(stats.items()))))
+
+    def __enter__(self):
+        self.reset()
+        self.enable()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.disable()
+
+# The registry the modules of amohs hook their stages into
+profiler = instrumentation()
+
+##### streaming #####
+def chunks(iterable, chunkSize):
+    """Yields lists of up to chunkSize items from iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunkSize))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+def poolMap(function, chunks, processes=1):
+    """Yields function(chunk) for every chunk, in order
+
+    With more than one process the chunks are handed to a pool of worker processes (function
+    has to be defined at the top level of a module). Only a few chunks per process are ever
+    waiting, so chunks can be an arbitrarily long stream."""
+    if processes is None or processes <= 1:
+        for chunk in chunks:
+            yield function(chunk)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(function, (chunk,)))
+            if len(pending) >= 2*processes:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+##### immutable value types #####
+def rebuildValue(cls, fields):
+    """Rebuilds a value type from its fields, used when unpickling"""
+    obj = object.__new__(cls)
+    obj.setFields(*fields)
+    return obj
+
+# the __set__ of the slot of every field of a value type, by class
+fieldSetters = {}
+
+def slotSetters(cls):
+    """The functions that set the slots of the fields of cls, in the order of fieldNames"""
+    try:
+        return fieldSetters[cls]
+    except KeyError:
+        return fieldSetters.setdefault(cls, tuple(getattr(cls, name).__set__ for name in cls.fieldNames))
+
+class valueType(object):
+    """Base class for immutable, hashable value types
+
+    Subclasses declare their attributes in __slots__ and the ones that make up the value in
+    fieldNames, and set them once with setFields (in the order of fieldNames). Two objects are equal if they are of the same
+    class and their fields are equal."""
+    __slots__ = ()
+    fieldNames = ()
+
+    def setFields(self, *values):
+        # the slot descriptors are set directly, around the __setattr__ that makes the object immutable
+        for setter, value in zip(slotSetters(type(self)), values):
+            setter(self, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s objects are immutable, can't set %s" % (self.__class__.__name__, name))
+
+    def __delattr__(self, name):
+        raise AttributeError("%s objects are immutable, can't delete %s" % (self.__class__.__name__, name))
+
+    def fields(self):
+        return tuple(getattr(self, name) for name in self.fieldNames)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.fields() == other.fields()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((type(self), self.fields()))
+
+    def __reduce__(self):
+        return (rebuildValue, (type(self), self.fields()))
+
+class internedValue(valueType):
+    """A value type with a single field, value, that is checked once and shared by everything with the same value
+
+    Subclasses define check(value), which returns the checked value or raises, and an interned
+    dictionary of their own."""
+    __slots__ = ("value",)
+    fieldNames = ("value",)
+    interned = None
+
+    def __new__(cls, value):
+        try:
+            return cls.interned[value]
+        except KeyError:
+            pass
+        checked = cls.check(value)
+        try:
+            obj = cls.interned[checked]
+        except KeyError:
+            obj = object.__new__(cls)
+            obj.setFields(checked)
+            cls.interned[checked] = obj
+        cls.interned[value] = obj
+        return obj
+
+    def __reduce__(self):
+        return (type(self), (self.value,))
@@ -1,3 +1,8 @@
+import funcs
+
+import numpy as np
+import sys
+
 ##### Error classes #####
 class digitError(Exception):
     pass
@@ -5,6 +10,9 @@ class digitError(Exception):
 class jointError(Exception):
     pass
 
+class specificationError(Exception):
+    pass
+
 ##### checking functions that make sure values are sane
 ##### variables defining various specifications #####
 jointWeight = {"wrist": 4,
@@ -14,58 +22,201 @@ jointWeight = {"wrist": 4,
             "ip":1,
             "dip":1}
 
+##### fixed array layout for arm configurations #####
+# Every arm configuration is stored as a single float array with one slot per
+# degree of freedom, in the order given by armLayout. Degrees of freedom that are
+# not specified (None in the object representation) are stored as nan.
+handDigits = ("index", "middle", "ring", "pinky", "thumb")
+wristDfs = ("dfFlex", "dfRot", "dfPro")
+fingerDfs = (("MCP", ("dfFlex", "dfAbd")),
+             ("PIP", ("dfFlex",)),
+             ("DIP", ("dfFlex",)))
+thumbDfs = (("CM", ("dfFlex", "dfAbd", "dfRot")),
+            ("MCP", ("dfFlex",)),
+            ("IP", ("dfFlex",)))
+
+def digitDfs(digit):
+    """Returns the joints and degrees of freedom stored for a digit"""
+    if digit == "thumb":
+        return thumbDfs
+    return fingerDfs
+
+handLayout = tuple((digit, jnt, df) for digit in handDigits for jnt, dfs in digitDfs(digit) for df in dfs)
+armLayout = tuple(("wrist", "wrist", df) for df in wristDfs) + handLayout
+armIndex = dict((key, i) for i, key in enumerate(armLayout))
+handSize = len(handLayout)
+wristSize = len(wristDfs)
+armSize = len(armLayout)
+# the slots of each digit in handLayout
+digitSizes = [sum(len(dfs) for jnt, dfs in digitDfs(digit)) for digit in handDigits]
+digitSlices = dict((digit, slice(sum(digitSizes[:i]), sum(digitSizes[:i+1]))) for i, digit in enumerate(handDigits))
+
+handWeights = np.array([jointWeight[jnt.lower()] for digit, jnt, df in handLayout], dtype=float)
+armWeights = np.array([jointWeight[jnt.lower()] for digit, jnt, df in armLayout], dtype=float)
+
+def number(value):
+    """Converts a numpy scalar to an int if it is integral, and a float otherwise"""
+    value = float(value)
+    if value.is_integer():
+        return int(value)
+    return value
+
+def jointToArray(jnt, dfs):
+    """Returns the values of the degrees of freedom dfs of a joint, with nan for unspecified ones"""
+    if jnt is None:
+        return [np.nan]*len(dfs)
+    for df in ("dfFlex", "dfAbd", "dfRot", "dfPro"):
+        if df not in dfs and getattr(jnt, df) is not None:
+            raise digitError("The degree of freedom %s can't be stored for this joint, only %s are." % (df, str(dfs)))
+    return [np.nan if getattr(jnt, df) is None else getattr(jnt, df) for df in dfs]
+
+def digitToArray(digitObj, digit):
+    """Returns the array slots of a finger or thumb"""
+    if digitObj is None:
+        return [np.nan]*(digitSlices[digit].stop - digitSlices[digit].start)
+    out = []
+    for jnt, dfs in digitDfs(digit):
+        out.extend(jointToArray(getattr(digitObj, jnt), dfs))
+    return out
+
+def arrayToJoint(values, dfs, jointClass):
+    """Builds a joint from array slots, without re-validating the values"""
+    kwargs = {}
+    for df, value in zip(dfs, values):
+        if not np.isnan(value):
+            kwargs[df] = number(value)
+    jnt = jointClass.__new__(jointClass)
+    jnt.setDfs(**kwargs)
+    return jnt
+
+def arrayToDigit(values, digit, digitClass, jointClass):
+    """Builds a finger or thumb from array slots without re-validating, None if no slot is specified"""
+    if np.isnan(values).all():
+        return None
+    joints = {}
+    start = 0
+    for jnt, dfs in digitDfs(digit):
+        joints[jnt] = arrayToJoint(values[start:start+len(dfs)], dfs, jointClass)
+        start += len(dfs)
+    digitObj = digitClass.__new__(digitClass)
+    digitObj.setFields(*[joints[jnt] for jnt in digitClass.fieldNames])
+    return digitObj
+
 ##### handshape class and recursion #####
-class armconfiguration:
-    """Representation for arm configruations"""
+class armconfiguration(object):
+    """Representation for arm configruations
+
+    The configuration is stored in self.angles, a float array in the order of armLayout.
+    The wrist and hand attributes are views on that array, and are built when they are first used."""
     def __init__(self, hand, wrist):
-        
-    	if isinstance(wrist, joint):
-    		wrist = wrist
+        if isinstance(wrist, joint):
+            wrist = wrist
         else:
-    		if ((type(wrist) is list) or (type(wrist) is tuple)) and len(wrist) == 3:
-    			wrist = joint(dfFlex=wrist[0], dfRot=wrist[1], dfPro=wrist[2])
-    		else:
-    			raise digitError("The wrist joint needs a list or tuple with exactly 3 degrees of freedom specified, got %s instead." % (str(wrist)))
-    	if wrist.df != 3:
-    		raise digitError("The wrist joint needs 3 degrees of freedom, got %s instead." % (str(wrist.df)))
-    	else:
-    		self.wrist = wrist
-        self.hand = hand
-    
+            if ((type(wrist) is list) or (type(wrist) is tuple)) and len(wrist) == 3:
+                wrist = joint(dfFlex=wrist[0], dfRot=wrist[1], dfPro=wrist[2])
+            else:
+                raise digitError("The wrist joint needs a list or tuple with exactly 3 degrees of freedom specified, got %s instead." % (str(wrist)))
+        if wrist.df != 3:
+            raise digitError("The wrist joint needs 3 degrees of freedom, got %s instead." % (str(wrist.df)))
+        if not isinstance(hand, handconfiguration):
+            raise digitError("The hand needs to be a handconfiguration, got %s instead." % (str(hand)))
+        self.angles = np.empty(armSize)
+        self.angles[:wristSize] = jointToArray(wrist, wristDfs)
+        self.angles[wristSize:] = hand.angles
+        self._wrist = wrist
+        self._hand = hand
+
+    @classmethod
+    def fromArray(cls, angles):
+        """Builds an arm configuration directly from an array in the order of armLayout"""
+        angles = np.asarray(angles, dtype=float)
+        if angles.shape != (armSize,):
+            raise digitError("An arm configuration needs an array of %s values, got shape %s instead." % (armSize, str(angles.shape)))
+        arm = cls.__new__(cls)
+        arm.angles = angles
+        arm._wrist = None
+        arm._hand = None
+        return arm
+
+    handClass = None # set to handconfiguration below
+    jointClass = None # set to joint below
+
+    @property
+    def wrist(self):
+        if self._wrist is None:
+            self._wrist = arrayToJoint(self.angles[:wristSize], wristDfs, self.jointClass)
+        return self._wrist
+
+    @property
+    def hand(self):
+        if self._hand is None:
+            self._hand = self.handClass.fromArray(self.angles[wristSize:])
+        return self._hand
+
     def __repr__(self):
         return "%s(wrist=%r, hand=%r)" % (self.__class__.__name__, self.wrist, self.hand)
-        
+
     def __str__(self):
         return """armconfiguration:
 wrist: %s
 hand: %s
 """ % (self.wrist, self.hand)
-    
+
     def __sub__(self, other):
-        if self.wrist and other.wrist: wristDiff = self.wrist - other.wrist
-        if self.hand and other.hand: handDiff = self.hand - other.hand
-        return armconfigurationDelta(wrist=wristDiff, hand=handDiff)
+        return armconfigurationDelta.fromArray(self.angles - other.angles)
 
 class armconfigurationDelta(armconfiguration):
     def totalDegreesDifferent(self):
-        degDiff = sum([self.wrist.totalDegreesDifferent(),
-                        self.hand.totalDegreesDifferent()])
-        return degDiff
-        
+        return number(np.nansum(np.abs(self.angles)))
+
     def weightedDegreesDifferent(self):
-        degDiff = sum([self.wrist.totalDegreesDifferent()*jointWeight["wrist"],
-                        self.hand.weightedDegreesDifferent()])
-        return degDiff
+        return number(np.nansum(np.abs(self.angles)*armWeights))
+
+class handconfiguration(object):
+    """Representation for hand configruations
 
-class handconfiguration:
-    """Representation for hand configruations"""
+    The configuration is stored in self.angles, a float array in the order of handLayout.
+    The digit attributes are views on that array, and are built when they are first used."""
     def __init__(self, index, middle, ring, pinky, thumb):
-        self.index = index
-        self.middle = middle
-        self.ring = ring
-        self.pinky = pinky
-        self.thumb = thumb
-    
+        digitObjs = (index, middle, ring, pinky, thumb)
+        self.angles = np.empty(handSize)
+        for digitObj, digit in zip(digitObjs, handDigits):
+            self.angles[digitSlices[digit]] = digitToArray(digitObj, digit)
+        self._digits = dict(zip(handDigits, digitObjs))
+
+    @classmethod
+    def fromArray(cls, angles):
+        """Builds a hand configuration directly from an array in the order of handLayout"""
+        angles = np.asarray(angles, dtype=float)
+        if angles.shape != (handSize,):
+            raise digitError("A hand configuration needs an array of %s values, got shape %s instead." % (handSize, str(angles.shape)))
+        hand = cls.__new__(cls)
+        hand.angles = angles
+        hand._digits = None
+        return hand
+
+    fingerClass = None # set to finger below
+    thumbClass = None # set to thumb below
+    jointClass = None # set to joint below
+
+    def digit(self, digit):
+        """Returns the finger or thumb object for a digit name"""
+        if self._digits is None:
+            self._digits = {}
+            for name in handDigits:
+                if name == "thumb":
+                    digitClass = self.thumbClass
+                else:
+                    digitClass = self.fingerClass
+                self._digits[name] = arrayToDigit(self.angles[digitSlices[name]], name, digitClass, self.jointClass)
+        return self._digits[digit]
+
+    index = property(lambda self: self.digit("index"))
+    middle = property(lambda self: self.digit("middle"))
+    ring = property(lambda self: self.digit("ring"))
+    pinky = property(lambda self: self.digit("pinky"))
+    thumb = property(lambda self: self.digit("thumb"))
+
     def __repr__(self):
         return "%s(index=%r, middle=%r, ring=%r, pinky=%r, thumb=%r)" % (self.__class__.__name__, self.index, self.middle, self.ring, self.pinky, self.thumb)
     def __str__(self):
@@ -75,66 +226,40 @@ middle: %s
 ring: %s
 pinky: %s
 thumb: %s""" % (self.index, self.middle, self.ring, self.pinky, self.thumb)
-    
+
     def __sub__(self, other):
-        if self.index and other.index: indexDiff = self.index - other.index
-        if self.middle and other.middle: middleDiff = self.middle - other.middle
-        if self.ring and other.ring: ringDiff = self.ring - other.ring
-        if self.pinky and other.pinky: pinkyDiff = self.pinky - other.pinky
-        if self.thumb and other.thumb: thumbDiff = self.thumb - other.thumb
-        return handconfigurationDelta(index=indexDiff, middle=middleDiff, ring=ringDiff, pinky=pinkyDiff, thumb=thumbDiff)
+        return handconfigurationDelta.fromArray(self.angles - other.angles)
 
 class handconfigurationDelta(handconfiguration):
     def totalDegreesDifferent(self):
-        degDiff = sum([self.index.totalDegreesDifferent(),
-                        self.middle.totalDegreesDifferent(),
-                        self.ring.totalDegreesDifferent(),
-                        self.pinky.totalDegreesDifferent(),
-                        self.thumb.totalDegreesDifferent()])
-        return degDiff
+        return number(np.nansum(np.abs(self.angles)))
 
     def weightedDegreesDifferent(self):
-        degDiff = sum([self.index.weightedDegreesDifferent(),
-                        self.middle.weightedDegreesDifferent(),
-                        self.ring.weightedDegreesDifferent(),
-                        self.pinky.weightedDegreesDifferent(),
-                        self.thumb.weightedDegreesDifferent()])
-        return degDiff    
-
-class finger:
+        return number(np.nansum(np.abs(self.angles)*handWeights))
+
+class finger(funcs.valueType):
     """A finger"""
+    __slots__ = fieldNames = ("MCP", "PIP", "DIP")
     def __init__(self, MCP, PIP, DIP):
         # ensure the that MCP is a joint instance, and has 2 degrees of freedom specified.
-	if isinstance(MCP, joint):
-		MCP = MCP
-        else:
-		if ((type(MCP) is list) or (type(MCP) is tuple)) and len(MCP) == 2:
-			MCP = joint(dfFlex=MCP[0], dfAbd=MCP[1])
-		else:
-			raise digitError("The MCP joint needs a list or tuple with exactly 2 degrees of freedom specified, got %s instead." % (str(MCP)))
-	if MCP.df != 2:
-		raise digitError("The MCP joint needs 2 degrees of freedom, got %s instead." % (str(MCP.df)))
-	else:
-		self.MCP = MCP
-        
+        if not isinstance(MCP, joint):
+            if ((type(MCP) is list) or (type(MCP) is tuple)) and len(MCP) == 2:
+                MCP = joint(dfFlex=MCP[0], dfAbd=MCP[1])
+            else:
+                raise digitError("The MCP joint needs a list or tuple with exactly 2 degrees of freedom specified, got %s instead." % (str(MCP)))
+        if MCP.df != 2:
+            raise digitError("The MCP joint needs 2 degrees of freedom, got %s instead." % (str(MCP.df)))
         # ensure the that PIP is a joint instance, and has 1 degree of freedom specified.
-	if isinstance(PIP, joint):
-		PIP = PIP
-        else:
-		PIP = joint(PIP)
-	if PIP.df != 1:
-		raise digitError("The PIP joint needs 1 degree of freedom, got %s instead." % (str(PIP.df)))
-	else:
-		self.PIP = PIP
+        if not isinstance(PIP, joint):
+            PIP = joint(PIP)
+        if PIP.df != 1:
+            raise digitError("The PIP joint needs 1 degree of freedom, got %s instead." % (str(PIP.df)))
         # ensure the that DIP is a joint instance, and has 1 degree of freedom specified.
-	if isinstance(DIP, joint):
-		DIP = DIP
-        else:
-		DIP = joint(DIP)
-	if DIP.df != 1:
-		raise digitError("The DIP joint needs 1 degree of freedom, got %s instead." % (str(DIP.df)))
-	else:
-		self.DIP = DIP
+        if not isinstance(DIP, joint):
+            DIP = joint(DIP)
+        if DIP.df != 1:
+            raise digitError("The DIP joint needs 1 degree of freedom, got %s instead." % (str(DIP.df)))
+        self.setFields(MCP, PIP, DIP)
         
     def __repr__(self):
         return "%s(MCP=%r, PIP=%r, DIP=%r)" % (self.__class__.__name__, self.MCP, self.PIP, self.DIP)
@@ -152,6 +277,7 @@ class finger:
         return fingerDelta(MCP=MCPDiff, PIP=PIPDiff, DIP=DIPDiff)
 
 class fingerDelta(finger):
+    __slots__ = ()
     def totalDegreesDifferent(self):
         degDiff = sum([self.MCP.totalDegreesDifferent(),self.PIP.totalDegreesDifferent(),self.DIP.totalDegreesDifferent()])
         return degDiff
@@ -160,39 +286,29 @@ class fingerDelta(finger):
         degDiff = sum([self.MCP.totalDegreesDifferent()*jointWeight["mcp"],self.PIP.totalDegreesDifferent()*jointWeight["pip"],self.DIP.totalDegreesDifferent()]*jointWeight["dip"])
         return degDiff
 
-class thumb:
+class thumb(funcs.valueType):
     """the thumb"""
+    __slots__ = fieldNames = ("CM", "MCP", "IP")
     def __init__(self, CM, MCP, IP):
         # ensure the that CM is a joint instance, and has 3 degrees of freedom specified.
-	if isinstance(CM, joint):
-		CM = CM
-        else:
-		if ((type(CM) is list) or (type(CM) is tuple)) and len(CM) == 3:
-			CM = joint(dfFlex=CM[0], dfAbd=CM[1], dfRot=CM[2])
-		else:
-			raise digitError("The CM joint needs a list or tuple with exactly 2 degrees of freedom specified, got %s instead." % (str(CM)))
-	if CM.df != 3:
-		raise digitError("The CM joint needs 2 degrees of freedom, got %s instead." % (str(CM.df)))
-	else:
-		self.CM = CM
+        if not isinstance(CM, joint):
+            if ((type(CM) is list) or (type(CM) is tuple)) and len(CM) == 3:
+                CM = joint(dfFlex=CM[0], dfAbd=CM[1], dfRot=CM[2])
+            else:
+                raise digitError("The CM joint needs a list or tuple with exactly 2 degrees of freedom specified, got %s instead." % (str(CM)))
+        if CM.df != 3:
+            raise digitError("The CM joint needs 2 degrees of freedom, got %s instead." % (str(CM.df)))
         # ensure the that MCP is a joint instance, and has 1 degree of freedom specified.
-	if isinstance(MCP, joint):
-		MCP = MCP
-        else:
-		MCP = joint(MCP)
-	if MCP.df != 1:
-		raise digitError("The MCP joint needs 1 degree of freedom, got %s instead." % (str(MCP.df)))
-	else:
-		self.MCP = MCP
+        if not isinstance(MCP, joint):
+            MCP = joint(MCP)
+        if MCP.df != 1:
+            raise digitError("The MCP joint needs 1 degree of freedom, got %s instead." % (str(MCP.df)))
         # ensure the that IP is a joint instance, and has 1 degree of freedom specified.
-	if isinstance(IP, joint):
-		IP = IP
-        else:
-		IP = joint(IP)
-	if IP.df != 1:
-		raise digitError("The IP joint needs 1 degree of freedom, got %s instead." % (str(IP.df)))
-	else:
-		self.IP = IP
+        if not isinstance(IP, joint):
+            IP = joint(IP)
+        if IP.df != 1:
+            raise digitError("The IP joint needs 1 degree of freedom, got %s instead." % (str(IP.df)))
+        self.setFields(CM, MCP, IP)
     
     def __repr__(self):
         return "%s(CM=%r, MCP=%r, IP=%r)" % (self.__class__.__name__, self.CM, self.MCP, self.IP)
@@ -210,6 +326,7 @@ class thumb:
         return thumbDelta(CM=CMDiff, MCP=MCPDiff, IP=IPDiff)
 
 class thumbDelta(thumb):
+    __slots__ = ()
     def totalDegreesDifferent(self):
         degDiff = sum([self.MCP.totalDegreesDifferent(),self.IP.totalDegreesDifferent(),self.CM.totalDegreesDifferent()])
         return degDiff
@@ -219,23 +336,27 @@ class thumbDelta(thumb):
         return degDiff
 
 ##### abstract articulator classes #####
-class joint:
+class joint(funcs.valueType):
     """a joint object"""
+    __slots__ = fieldNames = ("dfFlex", "dfAbd", "dfRot", "dfPro")
     def __init__(self, dfFlex=None, dfAbd=None, dfRot=None, dfPro=None):
         if dfFlex and type(dfFlex) is not int:
-		    raise jointError("The value for flexion must be a single integer. Got %s instead." % (str(dfFlex)))
+            raise jointError("The value for flexion must be a single integer. Got %s instead." % (str(dfFlex)))
         if dfAbd and type(dfAbd) is not int:
-		    raise jointError("The value for abduction must be a single integer. Got %s instead." % (str(dfAbd)))
+            raise jointError("The value for abduction must be a single integer. Got %s instead." % (str(dfAbd)))
         if dfRot and type(dfRot) is not int:
-		    raise jointError("The value for rotation must be a single integer. Got %s instead." % (str(dfRot)))
+            raise jointError("The value for rotation must be a single integer. Got %s instead." % (str(dfRot)))
         if dfPro and type(dfPro) is not int:
-		    raise jointError("The value for pronation must be a single integer. Got %s instead." % (str(dfPro)))
-        self.dfFlex = dfFlex
-        self.dfAbd = dfAbd
-        self.dfRot = dfRot
-        self.dfPro = dfPro
-	    # Count the number of degrees of freedom that are being used to return the dfs.
-        self.df = sum([int(item != None) for item in (self.dfFlex,self.dfAbd,self.dfRot,self.dfPro )])
+            raise jointError("The value for pronation must be a single integer. Got %s instead." % (str(dfPro)))
+        self.setDfs(dfFlex=dfFlex, dfAbd=dfAbd, dfRot=dfRot, dfPro=dfPro)
+
+    def setDfs(self, dfFlex=None, dfAbd=None, dfRot=None, dfPro=None):
+        self.setFields(dfFlex, dfAbd, dfRot, dfPro)
+
+    @property
+    def df(self):
+        # Count the number of degrees of freedom that are being used to return the dfs.
+        return sum([int(item != None) for item in (self.dfFlex, self.dfAbd, self.dfRot, self.dfPro)])
     
     def __sub__(self, other):
         dfFlexDiff = None
@@ -255,6 +376,7 @@ class joint:
         return """dfFlex: %s, dfAbd: %s, dfRot: %s, dfPro: %s""" % (self.dfFlex, self.dfAbd, self.dfRot, self.dfPro)
 
 class jointDelta(joint):
+    __slots__ = ()
     def totalDegreesDifferent(self):
         if self.dfFlex is None:
             dfFlexDiff = 0
@@ -275,25 +397,105 @@ class jointDelta(joint):
         degDiff = sum([dfFlexDiff,dfAbdDiff,dfRotDiff,dfProDiff])
         return degDiff
 
+##### batched comparisons #####
+def methodWeights(method, weights=armWeights):
+    """Returns the per degree of freedom weights for a method of measuring difference"""
+    if method == "unweighted":
+        return np.ones(len(weights))
+    elif method == "weighted":
+        return weights
+    else:
+        raise specificationError("No recognized method for measuring difference.")
+
+def armsToArray(arms):
+    """Stacks arm configurations into an N x armSize array
+
+    arms can be an array already, or any iterable of hc.armconfiguration or hs.arm objects."""
+    if isinstance(arms, np.ndarray):
+        angles = np.asarray(arms, dtype=float)
+        if angles.ndim != 2 or angles.shape[1] != armSize:
+            raise digitError("Arm configurations need an N x %s array, got shape %s instead." % (armSize, str(angles.shape)))
+        return angles
+    angles = []
+    for arm in arms:
+        if hasattr(arm, "toArmTarget"):
+            arm = arm.toArmTarget()
+        angles.append(arm.angles)
+    return np.array(angles, dtype=float).reshape(len(angles), armSize)
+
+def blockDegreesDifferent(anglesA, anglesB, weights):
+    """Returns the weighted degrees different between every row of anglesA and every row of anglesB
+
+    The sum is accumulated one degree of freedom at a time, so only two len(anglesA) x len(anglesB)
+    arrays are in memory at once. Unspecified degrees of freedom contribute nothing."""
+    out = np.zeros((len(anglesA), len(anglesB)))
+    for df in range(anglesA.shape[1]):
+        if weights[df] == 0:
+            continue
+        diff = np.abs(np.subtract.outer(anglesA[:,df], anglesB[:,df]))
+        diff[np.isnan(diff)] = 0
+        diff *= weights[df]
+        out += diff
+    return out
+
+def degreesDifferentMatrix(armsA, armsB=None, method="unweighted", blockSize=1024):
+    """Returns the matrix of degrees different between every arm in armsA and every arm in armsB
+
+    Entry [i, j] is the same as (armsA[i]-armsB[j]).totalDegreesDifferent() (or
+    weightedDegreesDifferent() with method="weighted"). If armsB is None armsA is compared with
+    itself: only the blocks on and above the diagonal are computed, and mirrored below it."""
+    weights = methodWeights(method)
+    anglesA = armsToArray(armsA)
+    if armsB is not None:
+        return blockDegreesDifferent(anglesA, armsToArray(armsB), weights)
+    n = len(anglesA)
+    out = np.zeros((n, n))
+    for start in range(0, n, blockSize):
+        stop = min(start+blockSize, n)
+        block = blockDegreesDifferent(anglesA[start:stop], anglesA[start:], weights)
+        out[start:stop, start:] = block
+        out[start:, start:stop] = block.T
+    return out
+
+##### array views #####
+armconfiguration.handClass = handconfiguration
+armconfiguration.jointClass = joint
+armconfigurationDelta.handClass = handconfigurationDelta
+armconfigurationDelta.jointClass = jointDelta
+handconfiguration.fingerClass = finger
+handconfiguration.thumbClass = thumb
+handconfiguration.jointClass = joint
+handconfigurationDelta.fingerClass = fingerDelta
+handconfigurationDelta.thumbClass = thumbDelta
+handconfigurationDelta.jointClass = jointDelta
+
+##### instrumentation, see funcs.profiler #####
+for cls in (armconfiguration, handconfiguration, finger, thumb, joint):
+    funcs.profiler.hook("delta", cls, "__sub__")
+for cls in (armconfigurationDelta, handconfigurationDelta, fingerDelta, thumbDelta):
+    funcs.profiler.hook("metric", cls, "totalDegreesDifferent", "weightedDegreesDifferent")
+funcs.profiler.hook("metric", jointDelta, "totalDegreesDifferent")
+funcs.profiler.hook("metric", sys.modules[__name__], "blockDegreesDifferent", "degreesDifferentMatrix")
+
 ##### testing #####
-index = finger(MCP=(0,-15), PIP=0, DIP=0)
-middle = finger(MCP=(30,0), PIP=90, DIP=0)
-ring = finger(MCP=(0,0), PIP=0, DIP=0)
-pinky = finger(MCP=(0,0), PIP=0, DIP=0)
-thmb = thumb(CM=(0,0,0), MCP=0, IP=0)
-wrist = (0,0,0)
-hc1 = handconfiguration(index, middle, ring, pinky, thmb)
-arm1 = armconfiguration(hc1, wrist)
-
-index = finger(MCP=(0,0), PIP=0, DIP=0)
-middle = finger(MCP=(90,0), PIP=90, DIP=0)
-ring = finger(MCP=(90,0), PIP=0, DIP=0)
-pinky = finger(MCP=(0,0), PIP=0, DIP=0)
-thmb = thumb(CM=(0,0,0), MCP=0, IP=0)
-wrist = (0,0,0)
-hc2 = handconfiguration(index, middle, ring, pinky, thmb)
-arm2 = armconfiguration(hc1, wrist)
-
-hcDiff = hc1-hc2
-armDiff = arm1-arm2
+if __name__ == "__main__":
+    index = finger(MCP=(0,-15), PIP=0, DIP=0)
+    middle = finger(MCP=(30,0), PIP=90, DIP=0)
+    ring = finger(MCP=(0,0), PIP=0, DIP=0)
+    pinky = finger(MCP=(0,0), PIP=0, DIP=0)
+    thmb = thumb(CM=(0,0,0), MCP=0, IP=0)
+    wrist = (0,0,0)
+    hc1 = handconfiguration(index, middle, ring, pinky, thmb)
+    arm1 = armconfiguration(hc1, wrist)
+
+    index = finger(MCP=(0,0), PIP=0, DIP=0)
+    middle = finger(MCP=(90,0), PIP=90, DIP=0)
+    ring = finger(MCP=(90,0), PIP=0, DIP=0)
+    pinky = finger(MCP=(0,0), PIP=0, DIP=0)
+    thmb = thumb(CM=(0,0,0), MCP=0, IP=0)
+    wrist = (0,0,0)
+    hc2 = handconfiguration(index, middle, ring, pinky, thmb)
+    arm2 = armconfiguration(hc1, wrist)
 
+    hcDiff = hc1-hc2
+    armDiff = arm1-arm2
@@ -1,4 +1,7 @@
 import hc
+import funcs
+
+import numpy as np
 
 ##### Error classes #####
 class digitError(Exception):
@@ -44,13 +47,13 @@ reverseOrientations = dict(reversed(item) for item in phonoOrientations.items())
 ##### checking functions that make sure values are sane
 def fingerCheck(members, digits = digits):
     """Checks that members are all in the digits set"""
-    # ensure that members is a set
+    # ensure that members is a (frozen) set
     if members == None:
-        members = set()
+        members = frozenset()
     elif type(members) is str:
-        members = set([members])
+        members = frozenset([members])
     else:
-        members = set(members)
+        members = frozenset(members)
     if not digits.issuperset(members):
         raise digitError("At least one of the members provided is not in the digits set.")
     return members
@@ -80,108 +83,68 @@ def oppositionCheck(oppos, oppositions = phonoOpposition):
     return oppos
 
 ##### handshape class and recursion #####
-class arm:
+class arm(funcs.valueType):
     """Representation of wrist+handshape, to be expanded with elbow and shoulder later"""
+    __slots__ = fieldNames = ("handshape", "orientation")
     def __init__(self, handshape, orientation=None):
-        self.handshape = handshape
         if orientation == None:
-            self.orientation = "default"
-        else:
-            self.orientation = orientation
-        
+            orientation = "default"
+        self.setFields(handshape, orientation)
+
     def toArmTarget(self):
-        wrist = hc.joint(dfFlex=phonoOrientations[self.orientation][0], dfRot=phonoOrientations[self.orientation][1], dfPro=phonoOrientations[self.orientation][2])
-        return hc.armconfiguration(hand=self.handshape.toHandconfigTarget() , wrist=wrist)
+        # the angles are written straight into the layout, the objects are built from them when they are used
+        angles = np.empty(hc.armSize)
+        angles[:hc.wristSize] = phonoOrientations[self.orientation]
+        angles[hc.wristSize:] = self.handshape.handAngles()
+        return hc.armconfiguration.fromArray(angles)
 
-class handshape:
+class handshape(funcs.valueType):
     """Representation of handshapes using the articulatory model of handshape"""
+    __slots__ = fieldNames = ("SF", "SSF", "thumb", "NSF")
     def __init__(self, selectedFingers, secondarySelectedFingers, thumb, nonSelectedFingers):
-        self.SF = selectedFingers
-        self.SSF = secondarySelectedFingers
-        self.thumb = thumb
-        if self.SSF and not self.SF.members.isdisjoint(self.SSF.members):
+        SF = selectedFingers
+        SSF = secondarySelectedFingers
+        if SSF and not SF.members.isdisjoint(SSF.members):
             raise digitError("The members of selected and secodnary selected finger groups overlap.")            
-        self.NSF =  nonSelectedFingers
-        if self.NSF and self.SSF:
-            self.NSF.members = digits - (self.SF.members | self.SSF.members)
-        elif self.NSF:
-            self.NSF.members = digits - (self.SF.members)
-        #make SSF and NSF are None if there are no members
-        if self.SSF and len(self.SSF.members) == 0:
-            self.SSF.members = None
-        if self.NSF and len(self.NSF.members) == 0:
-            self.NSF.members = None
-
-    def toHandconfigTarget(self):
-        handconfig = {
-        "index" : None,
-        "middle" : None,
-        "ring" : None,
-        "pinky" : None,
-        "thumb" : None
-        }
-        
-        for finger in self.SF.members:
-            if finger !=  "thumb":
-                handconfig[finger] = hc.finger(
-                    MCP=hc.joint(dfFlex=phonoJoints[self.SF.MCP.value],
-                             dfAbd=phonoAbduction[finger][self.SF.abd.value]),
-                    PIP=hc.joint(dfFlex=phonoJoints[self.SF.PIP.value]),
-                    DIP=hc.joint(dfFlex=phonoJoints[self.SF.PIP.value])
-                )
-            else:
-                handconfig[finger] = hc.thumb(
-                    MCP=hc.joint(dfFlex=phonoJoints[self.SF.MCP.value]),
-                    IP=hc.joint(dfFlex=phonoJoints[self.SF.PIP.value]),
-                    CM=hc.joint(
-                            dfFlex=phonoAbduction[finger][self.SF.abd.value][self.thumb.oppos.value][0],
-                            dfAbd=phonoAbduction[finger][self.SF.abd.value][self.thumb.oppos.value][2],
-                            dfRot=phonoAbduction[finger][self.SF.abd.value][self.thumb.oppos.value][1])
-                )                
+        NSF = nonSelectedFingers
+        # the nonselected fingers are the digits that aren't (secondary) selected
+        if NSF and SSF:
+            NSF = nonSelectedFingers.__class__(joints=NSF.joints, members=digits - (SF.members | SSF.members))
+        elif NSF:
+            NSF = nonSelectedFingers.__class__(joints=NSF.joints, members=digits - (SF.members))
+        self.setFields(SF, SSF, thumb, NSF)
+
+    def handAngles(self):
+        """The angles of the hand configuration target, an array in the order of hc.handLayout (nan for the digits that aren't specified)"""
+        angles = np.empty(hc.handSize)
+        angles.fill(np.nan)
+        groups = [self.SF]
         if self.SSF is not None:
-            for finger in self.SSF.members:
+            groups.append(self.SSF)
+        for group in groups:
+            for finger in group.members:
                 if finger !=  "thumb":
-                    handconfig[finger] = hc.finger(
-                        MCP=hc.joint(dfFlex=phonoJoints[self.SSF.MCP.value],
-                             dfAbd=phonoAbduction[finger][self.SSF.abd.value]),
-                    	PIP=hc.joint(dfFlex=phonoJoints[self.SSF.PIP.value]),
-                    	DIP=hc.joint(dfFlex=phonoJoints[self.SSF.PIP.value])
-                    )
-            	else:	
-                	handconfig[finger] = hc.thumb(
-                    	MCP=hc.joint(dfFlex=phonoJoints[self.SSF.MCP.value]),
-                    	IP=hc.joint(dfFlex=phonoJoints[self.SSF.PIP.value]),
-                    	CM=hc.joint(                    
-                                dfFlex=phonoAbduction[finger][self.SSF.abd.value][self.thumb.oppos.value][0],
-                                dfAbd=phonoAbduction[finger][self.SSF.abd.value][self.thumb.oppos.value][2],
-                                dfRot=phonoAbduction[finger][self.SSF.abd.value][self.thumb.oppos.value][1])
-                    )  
-
+                    angles[hc.digitSlices[finger]] = (phonoJoints[group.MCP.value], phonoAbduction[finger][group.abd.value],
+                                                      phonoJoints[group.PIP.value], phonoJoints[group.PIP.value])
+                else:
+                    CM = phonoAbduction[finger][group.abd.value][self.thumb.oppos.value]
+                    angles[hc.digitSlices[finger]] = (CM[0], CM[2], CM[1], phonoJoints[group.MCP.value], phonoJoints[group.PIP.value])
         if self.NSF is not None:
+            flex = phonoJoints[self.NSF.joints.value]
+            if self.NSF.joints.value == "ext":
+                NSFAbd = "abducted"
+            else:
+                NSFAbd = "adducted"
             for finger in self.NSF.members:
-                if self.NSF.joints.value == "ext":
-                    NSFAbd = "neutralAbducted"
-                    NSFAbd = "abducted"
-                else:
-                    NSFAbd = "adducted"
                 if finger !=  "thumb":
-                    handconfig[finger] = hc.finger(
-                        MCP=hc.joint(dfFlex=phonoJoints[self.NSF.joints.value],
-                             dfAbd=phonoAbduction[finger][NSFAbd]),
-                        PIP=hc.joint(dfFlex=phonoJoints[self.NSF.joints.value]),
-                        DIP=hc.joint(dfFlex=phonoJoints[self.NSF.joints.value])
-                        )
+                    angles[hc.digitSlices[finger]] = (flex, phonoAbduction[finger][NSFAbd], flex, flex)
                 else:
-                    handconfig[finger] = hc.thumb(
-                        MCP=hc.joint(dfFlex=phonoJoints[self.NSF.joints.value]),
-                        IP=hc.joint(dfFlex=phonoJoints[self.NSF.joints.value]),
-                    	CM=hc.joint(                    
-                                dfFlex=phonoAbduction[finger][NSFAbd]["unopposed"][0],
-                                dfAbd=phonoAbduction[finger][NSFAbd]["unopposed"][2],
-                                dfRot=phonoAbduction[finger][NSFAbd]["unopposed"][1])
-                        )
-        # Check!
-        return  hc.handconfiguration(handconfig["index"], handconfig["middle"], handconfig["ring"], handconfig["pinky"], handconfig["thumb"] )
+                    CM = phonoAbduction[finger][NSFAbd]["unopposed"]
+                    angles[hc.digitSlices[finger]] = (CM[0], CM[2], CM[1], flex, flex)
+        return angles
+
+    def toHandconfigTarget(self):
+        return hc.handconfiguration.fromArray(self.handAngles())
         
     def __repr__(self):
         return "%s(selectedFingers=%r, secondarySelectedFingers=%r, thumb=%r, nonSelectedFingers=%r)" % (self.__class__.__name__, self.SF, self.SSF, self.thumb, self.NSF)
@@ -194,8 +157,9 @@ Thumb: %s
 Non Selected Fingers: %s
 """ % (self.SF, self.SSF, self.thumb, self.NSF)
 
-class selectedFingers:
+class selectedFingers(funcs.valueType):
     """The selected fingers"""
+    __slots__ = fieldNames = ("members", "MCP", "PIP", "abd")
     def __init__(self, members, MCP, PIP, abd):
         # check the members
         try:
@@ -203,23 +167,16 @@ class selectedFingers:
         except digitError:
             print("Selected finger digit error.")
             raise
-        self.members = members
-        # ensure the that MCP is a joint instance
-        if isinstance(MCP, joint):
-            self.MCP = MCP
-        else:
-            self.MCP = joint(MCP)
-        # ensure the that PIP is a joint instance            
-        if isinstance(PIP, joint):
-            self.PIP = PIP
-        else:
-            self.PIP = joint(PIP)
+        # ensure the that MCP, PIP and abd are joint and abduction instances (these are interned)
+        MCP = joint(MCP)
+        PIP = joint(PIP)
+        abd = abduction(abd)
+        self.setFields(members, MCP, PIP, abd)
+
+    @property
+    def DIP(self):
         # duplicate the PIP configuration to the DIP, this should be refined
-        self.DIP = self.PIP 
-        if isinstance(abd, abduction):
-            self.abd = abd
-        else:
-            self.abd = abduction(abd)
+        return self.PIP
 
     def __repr__(self):
         return "%s(members=%r, MCP=%r, PIP=%r, abd=%r)" % (self.__class__.__name__, self.members, self.MCP, self.PIP, self.abd)
@@ -231,8 +188,9 @@ class selectedFingers:
   PIP: %s
   abd: %s""" % (self.members, self.MCP, self.PIP, self.abd)
     
-class secondarySelectedFingers:
+class secondarySelectedFingers(funcs.valueType):
     """The secondary selected fingers"""
+    __slots__ = fieldNames = ("members", "MCP", "PIP", "abd")
     def __init__(self, members=None, MCP=None, PIP=None, abd=None):
         # check the members
         try:
@@ -240,28 +198,21 @@ class secondarySelectedFingers:
         except digitError:
             print("Selected finger digit error.")
             raise
-        self.members = members
-        # ensure the that MCP is a joint instance
-        if isinstance(MCP, joint):
-            self.MCP = MCP
-        else:
-            self.MCP = joint(MCP)
-        # ensure the that PIP is a joint instance            
-        if isinstance(PIP, joint):
-            self.PIP = PIP
-        else:
-            self.PIP = joint(PIP)
-        # duplicate the PIP configuration, this should be refined
-        self.DIP = self.PIP
-        if isinstance(abd, abduction):
-            self.abd = abd
-        else:
-            self.abd = abduction(abd)
+        # ensure the that MCP, PIP and abd are joint and abduction instances (these are interned)
+        MCP = joint(MCP)
+        PIP = joint(PIP)
+        abd = abduction(abd)
         # if members is empty, set all to None:
         if len(members) == 0:
-            self.MCP = None
-            self.PIP = None
-            self.abd = None
+            MCP = None
+            PIP = None
+            abd = None
+        self.setFields(members, MCP, PIP, abd)
+
+    @property
+    def DIP(self):
+        # duplicate the PIP configuration, this should be refined
+        return self.PIP
             
     def __repr__(self):
         return "%s(members=%r, MCP=%r, PIP=%r, abd=%r)" % (self.__class__.__name__, self.members, self.MCP, self.PIP, self.abd)
@@ -274,13 +225,11 @@ class secondarySelectedFingers:
   abd: %s
 """ % (self.members, self.MCP, self.PIP, self.abd)
     
-class thumb:
+class thumb(funcs.valueType):
     """the thumb"""
+    __slots__ = fieldNames = ("oppos",)
     def __init__(self, oppos=None):
-        if isinstance(oppos, opposition):
-            self.oppos = oppos
-        else:
-            self.oppos = opposition(oppos)
+        self.setFields(opposition(oppos))
 
     def __repr__(self):
         return "%s(oppos=%r)" % (self.__class__.__name__, self.oppos)
@@ -290,20 +239,17 @@ class thumb:
   Opposition: %s
 """ % (self.oppos)
     
-class nonSelectedFingers:
+class nonSelectedFingers(funcs.valueType):
     """the non selected fingers"""
-    def __init__(self, joints=None, members = set()):
+    __slots__ = fieldNames = ("joints", "members")
+    def __init__(self, joints=None, members = frozenset()):
         try:
             members = fingerCheck(members)
         except digitError:
             print("Nonselected finger digit error.")
             raise
-        self.members = members
-        # ensure the that joints is a joint instance            
-        if isinstance(joints, joint):
-            self.joints = joints
-        else:
-            self.joints = joint(joints)        
+        # ensure the that joints is a joint instance (these are interned)
+        self.setFields(joint(joints), members)
         
     def __repr__(self):
         return "%s(joints=%r, members=%r)" % (self.__class__.__name__, self.joints, self.members)
@@ -315,15 +261,21 @@ class nonSelectedFingers:
 """ % (self.members, self.joints)
 
 ##### abstract articulator classes #####
-class joint:
+# These are interned: there is only one object for each phonologically specified value.
+class joint(funcs.internedValue):
     """a joint object"""
-    def __init__(self, value):
+    __slots__ = ()
+    interned = {}
+
+    @staticmethod
+    def check(value):
+        if isinstance(value, joint):
+            return value.value
         try:
-            value = jointCheck(value, joints = phonoJoints)
+            return jointCheck(value, joints = phonoJoints)
         except jointError:
             print("The joint is not in the set of phonologically specified joint features.")
             raise
-        self.value = value
 
     def __repr__(self):
         return "%s(value=%r)" % (self.__class__.__name__, self.value)
@@ -331,15 +283,20 @@ class joint:
     def __str__(self):
         return "%s" % (self.value)
 
-class opposition:
+class opposition(funcs.internedValue):
     """an oppotision object"""
-    def __init__(self, value):
+    __slots__ = ()
+    interned = {}
+
+    @staticmethod
+    def check(value):
+        if isinstance(value, opposition):
+            return value.value
         try:
-            value = oppositionCheck(value, oppositions = phonoOpposition)
+            return oppositionCheck(value, oppositions = phonoOpposition)
         except oppositionError:
             print("The opposition is not in the set of phonologically specified opposition features.")
             raise
-        self.value = value
 
     def __repr__(self):
         return "%s(value=%r)" % (self.__class__.__name__, self.value)
@@ -347,15 +304,20 @@ class opposition:
     def __str__(self):
         return "%s" % (self.value)
 
-class abduction:
+class abduction(funcs.internedValue):
     """a abduction object"""
-    def __init__(self, value):
+    __slots__ = ()
+    interned = {}
+
+    @staticmethod
+    def check(value):
+        if isinstance(value, abduction):
+            return value.value
         try:
-            value = abdCheck(value, abds = phonoAbduction["index"]) # the index is hard coded here for the check to work, this is a little weird and should be abstracted.
+            return abdCheck(value, abds = phonoAbduction["index"]) # the index is hard coded here for the check to work, this is a little weird and should be abstracted.
         except abductionError:
             print("The abduction is not in the set of phonologically specified abduction features.")
             raise
-        self.value = value
         
     def __repr__(self):
         return "%s(value=%r)" % (self.__class__.__name__, self.value)
@@ -363,15 +325,18 @@ class abduction:
     def __str__(self):
         return "%s" % (self.value)    
 
+##### instrumentation, see funcs.profiler #####
+funcs.profiler.hook("am to hc", handshape, "toHandconfigTarget")
+funcs.profiler.hook("am to hc", arm, "toArmTarget")
 
 ##### testing #####
-foo = handshape(
-    selectedFingers = selectedFingers(members = ["index", "middle"], MCP=joint("ext"), PIP="ext", abd=abduction("adducted")),
-    secondarySelectedFingers = None,
-    thumb = thumb(oppos=None),
-    nonSelectedFingers = nonSelectedFingers(joints="flex")
-    )
-bar = foo.toHandconfigTarget()
-baz = arm(handshape=foo, orientation="defaultFS")
-qux = baz.toArmTarget()
-
+if __name__ == "__main__":
+    foo = handshape(
+        selectedFingers = selectedFingers(members = ["index", "middle"], MCP=joint("ext"), PIP="ext", abd=abduction("adducted")),
+        secondarySelectedFingers = None,
+        thumb = thumb(oppos=None),
+        nonSelectedFingers = nonSelectedFingers(joints="flex")
+        )
+    bar = foo.toHandconfigTarget()
+    baz = arm(handshape=foo, orientation="defaultFS")
+    qux = baz.toArmTarget()
@@ -0,0 +1,36 @@
+"""Measures how long a fresh interpreter takes to import amohs, so that slow or noisy imports are caught"""
+import subprocess, sys
+from os import path
+
+##### Error classes #####
+class importTimeError(Exception):
+    pass
+
+##### the budget for importing every module, in seconds #####
+importTimeBudget = 0.5
+modules = ("funcs", "hc", "hs", "pm", "letters", "search", "space", "records", "render", "trajectory")
+if sys.version_info >= (3, 7):
+    # aio uses async def
+    modules += ("aio",)
+
+def measureImportTime(modules=modules, repeats=5):
+    """Returns the shortest time (in seconds) that a fresh interpreter took to import modules, out of repeats tries"""
+    code = "import time; start = time.time(); import %s; print(time.time() - start)" % ", ".join(modules)
+    times = []
+    for i in range(repeats):
+        out = subprocess.check_output([sys.executable, "-c", code], cwd=path.dirname(path.abspath(__file__)))
+        lines = out.decode().strip().splitlines()
+        if len(lines) != 1:
+            raise importTimeError("Importing should not print anything, but it printed:\n%s" % "\n".join(lines[:-1]))
+        times.append(float(lines[0]))
+    return min(times)
+
+def checkImportTime(budget=importTimeBudget, modules=modules):
+    """Raises an importTimeError if importing modules takes longer than budget seconds"""
+    importTime = measureImportTime(modules)
+    if importTime > budget:
+        raise importTimeError("Importing %s took %.3f seconds, the budget is %.3f seconds." % (", ".join(modules), importTime, budget))
+    return importTime
+
+if __name__ == "__main__":
+    print("Importing took %.3f seconds (budget: %.3f seconds)" % (checkImportTime(), importTimeBudget))
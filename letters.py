@@ -1,22 +1,53 @@
 import hs
+import hc
 import pm
 import funcs
 
-import csv
+import csv, sys
+import numpy as np
 from os import path
 
 ##### Error classes #####
 class specificationError(Exception):
     pass
 
-##### Read in csvs with letter specifications #####
-lettersFile = path.join(funcs.resources_dir,'lettersFromArtModel.csv')
-lettersKey = funcs.read_csv_data(lettersFile)
-lettersCols = funcs.dictToCols(lettersKey)
-letterCodingCols = funcs.dictColMapper(lettersKey, "letter")
+##### Cache of converted letters #####
+letterCache = funcs.conversionCache("letters")
 
-def letterToArm(letter):
+##### Read in csvs with letter specifications, the first time they are needed #####
+# a resource (see funcs.resourceData), or the path of a file in a directory
+lettersFile = 'lettersFromArtModel.csv'
+lettersLoaded = False
+
+def buildLetters(lettersData):
+    """Builds the lookup tables of the letter specifications from the bytes of their csv"""
+    lettersKey = funcs.resourceCSV(lettersData)
+    return {"lettersKey": lettersKey, "lettersCols": funcs.dictToCols(lettersKey), "letterCodingCols": funcs.dictColMapper(lettersKey, "letter")}
+
+def loadLetters(lettersFile=lettersFile):
+    """(Re)reads the letter specifications, and clears the cache of converted letters"""
+    global lettersKey, lettersCols, letterCodingCols, letterIndex, lettersLoaded
+    if path.dirname(lettersFile) != "":
+        lettersFile = path.abspath(lettersFile)
+    tables = buildLetters(funcs.resourceData(lettersFile))
+    lettersKey = tables["lettersKey"]
+    lettersCols = tables["lettersCols"]
+    letterCodingCols = tables["letterCodingCols"]
+    letterIndex = dict((ltr, i) for i, ltr in enumerate(lettersCols["letter"]))
+    letterCache.clear()
+    lettersLoaded = True
+
+def ensureLetters():
+    """Reads the letter specifications if they haven't been read yet"""
+    if not lettersLoaded:
+        loadLetters()
+
+# the tables are read the first time one of them is used
+funcs.lazyTables(sys.modules[__name__], ("lettersKey", "lettersCols", "letterCodingCols", "letterIndex"), ensureLetters)
+
+def letterToArm(letter, orientation=None):
     """converts a letter to an articulatory model representation of handshape"""
+    ensureLetters()
     try:
         let = letterCodingCols[letter]
     except KeyError:
@@ -51,10 +82,20 @@ def letterToArm(letter):
         thumb = thmb,
         nonSelectedFingers = nsf
         )
-    orientation = let["orientation"]
+    if orientation is None:
+        orientation = let["orientation"]
     return hs.arm(handshape=handshape, orientation=orientation)
+
+def cachedLetterToArm(letter, orientation=None):
+    """Like letterToArm, but the arm is cached per letter and orientation and shared between calls, so it should not be changed"""
+    return letterCache.get(("arm", letter, orientation), lambda: letterToArm(letter, orientation))
+
+def cachedLetterToArmTarget(letter, orientation=None):
+    """Returns the (cached, shared) arm configuration target for a letter"""
+    return letterCache.get(("target", letter, orientation), lambda: cachedLetterToArm(letter, orientation).toArmTarget())
         
 def printAllLetters():
+    ensureLetters()
     for letter in lettersKey:
     	 print("####################")
     	 print(letter["letter"])
@@ -63,76 +104,192 @@ def printAllLetters():
 def ntuples(lst, n):
     return zip(*[lst[i:]+lst[:i-1] for i in range(n)])
          
+def transitionCosts(method="unweighted"):
+    """Returns the (cached) table of costs between every pair of letters, indexed by letterIndex"""
+    if method not in ("unweighted", "weighted"):
+        raise specificationError("No recognized method for measuring contour.")
+    def build():
+        ensureLetters()
+        targets = [cachedLetterToArmTarget(ltr) for ltr in lettersCols["letter"]]
+        return hc.degreesDifferentMatrix(targets, method=method)
+    return letterCache.get(("transitionCosts", method), build)
+
+def letterCodes(string):
+    """Returns the positions in letterIndex of the letters in string"""
+    ensureLetters()
+    try:
+        return np.array([letterIndex[ltr] for ltr in string], dtype=int)
+    except KeyError:
+        print("That is not a recognized letter")
+        raise
+
 def measureContour(string, method="unweighted"):
-    stringTup = tuple(string)
-    cost = []
-    for pair in ntuples(stringTup,2):
-        c =  letterToArm(pair[0]).toArmTarget()-letterToArm(pair[1]).toArmTarget()
-        if method == "unweighted":
-            c = c.totalDegreesDifferent()
-        elif method == "weighted":
-            c = c.weightedDegreesDifferent()
-        else:
-            raise specificationError("No recognized method for measuring contour.")
-        cost.append(c)
-    return sum(cost)
+    costs = transitionCosts(method)
+    codes = letterCodes(string)
+    return hc.number(costs[codes[:-1], codes[1:]].sum())
+
+def measureContours(strings, method="unweighted"):
+    """measureContour for many strings at once, returns an array with the cost of each string"""
+    costs = transitionCosts(method)
+    codes = [letterCodes(string) for string in strings]
+    lengths = np.array([len(code) for code in codes], dtype=int)
+    if len(codes) == 0:
+        return np.zeros(0)
+    codes = np.concatenate(codes)
+    # costs of all adjacent pairs, including those that span two strings, which are skipped below
+    cumCosts = np.concatenate(([0], np.cumsum(costs[codes[:-1], codes[1:]])))
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    return cumCosts[np.maximum(ends-1, starts)] - cumCosts[starts]
 
 def similarity(stringA, stringB, method="unweighted"):
     if len(stringA) != len(stringB):
         raise specificationError("The strings are not of the same length, cannot compare without some sort of editing")
-    cost = []
-    for pair in zip(stringA,stringB):
-        c = letterToArm(pair[0]).toArmTarget()-letterToArm(pair[1]).toArmTarget()
-        if method == "unweighted":
-            c = c.totalDegreesDifferent()
-        elif method == "weighted":
-            c = c.weightedDegreesDifferent()
-        else:
-            raise specificationError("No recognized method for measuring contour.")
-        cost.append(c)
-    return sum(cost)    
-    
+    costs = transitionCosts(method)
+    return hc.number(costs[letterCodes(stringA), letterCodes(stringB)].sum())
+
+##### edit distances #####
+def indelCost(method="unweighted"):
+    """The default cost of inserting or deleting a letter: half the largest substitution cost, so substituting is never worse than deleting and inserting"""
+    return letterCache.get(("indelCost", method), lambda: hc.number(transitionCosts(method).max()/2.))
+
+def editDistance(stringA, stringB, method="unweighted", insertCost=None, deleteCost=None, maxCost=None):
+    """The articulatory edit distance between two strings of (possibly) different lengths
+
+    Substituting one letter for another costs as much as the transition between them (see
+    transitionCosts), inserting a letter of stringB costs insertCost and deleting a letter of
+    stringA costs deleteCost (both indelCost(method) by default). If maxCost is given, distances
+    greater than it are inf."""
+    return hc.number(editDistances(stringA, [stringB], method, insertCost, deleteCost, maxCost)[0])
+
+def editDistances(query, strings, method="unweighted", insertCost=None, deleteCost=None, maxCost=None):
+    """editDistance from query to each of strings, returns an array with the distance for each string
+
+    The strings are aligned with the query together, one letter of the query at a time. With a
+    maxCost only the band of columns around the diagonal (the alignments that could cost less
+    than maxCost) is computed for each letter, and strings are dropped as soon as every
+    alignment costs more than maxCost (their distance is inf)."""
+    costs = transitionCosts(method)
+    if insertCost is None:
+        insertCost = indelCost(method)
+    if deleteCost is None:
+        deleteCost = indelCost(method)
+    if insertCost < 0 or deleteCost < 0:
+        raise specificationError("Insertion and deletion costs can't be negative.")
+    queryCodes = letterCodes(query)
+    codes = [letterCodes(string) for string in strings]
+    distances = np.empty(len(codes))
+    distances.fill(np.inf)
+    if len(codes) == 0:
+        return distances
+    lengths = np.array([len(code) for code in codes], dtype=int)
+    width = lengths.max() + 1
+    # the strings, padded to the same length (the padding never affects the distance of a string)
+    padded = np.zeros((len(codes), width-1), dtype=int)
+    for row, code in enumerate(codes):
+        padded[row, :len(code)] = code
+    columns = np.arange(width)
+    band = None
+    active = np.arange(len(codes))
+    if maxCost is not None:
+        # every letter of difference in length needs an insertion or deletion
+        if min(insertCost, deleteCost) > 0:
+            band = int(np.floor(float(maxCost) / min(insertCost, deleteCost)))
+            active = active[np.abs(lengths - len(queryCodes)) <= band]
+    # the cost of aligning the first i letters of the query with the first j letters of each string
+    previous = np.tile(columns * float(insertCost), (len(active), 1))
+    if band is not None:
+        previous[:, band+1:] = np.inf
+    for i, queryCode in enumerate(queryCodes, 1):
+        # only columns lo to hi are computed, the rest of the row is outside of the band (and inf)
+        lo, hi = 0, width
+        if band is not None:
+            lo, hi = max(0, i-band), min(width, i+band+1)
+        current = np.empty_like(previous)
+        current[:, :lo] = np.inf
+        current[:, hi:] = np.inf
+        start = max(lo, 1)
+        if lo == 0:
+            current[:, 0] = previous[:, 0] + deleteCost
+        if start < hi:
+            substitute = previous[:, start-1:hi-1] + costs[queryCode, padded[active, start-1:hi-1]]
+            current[:, start:hi] = np.minimum(substitute, previous[:, start:hi] + deleteCost)
+        # insertions, current[j] = min over k <= j of current[k] + (j-k)*insertCost
+        current[:, lo:hi] = np.minimum.accumulate(current[:, lo:hi] - columns[lo:hi]*insertCost, axis=1) + columns[lo:hi]*insertCost
+        if maxCost is not None:
+            # abandon strings whose every alignment already costs more than maxCost
+            keep = current.min(axis=1) <= maxCost
+            active = active[keep]
+            current = current[keep]
+        previous = current
+    distances[active] = previous[np.arange(len(active)), lengths[active]]
+    if maxCost is not None:
+        distances[distances > maxCost] = np.inf
+    return distances
+
+def nearestStrings(query, strings, k=10, method="unweighted", insertCost=None, deleteCost=None, maxCost=None):
+    """The (at most) k strings closest to query by editDistance, as a list of (distance, string) tuples"""
+    strings = list(strings)
+    distances = editDistances(query, strings, method, insertCost, deleteCost, maxCost)
+    order = np.argsort(distances, kind="mergesort")[:k]
+    return [(hc.number(distances[i]), strings[i]) for i in order if np.isfinite(distances[i])]
+
 def letterToPM(letter):
     """converts a letter to a prosodic model code"""
+    ensureLetters()
     try:
         let = letterCodingCols[letter]
     except KeyError:
         print("That is not a recognized letter")
         raise
     return pm.pmHandshape(let["pmCode"])
+
+def cachedLetterToPM(letter):
+    """Like letterToPM, but the prosodic model handshape is cached and shared between calls, so it should not be changed"""
+    return letterCache.get(("pm", letter), lambda: letterToPM(letter))
     
+##### instrumentation, see funcs.profiler #####
+funcs.profiler.hook("contour", sys.modules[__name__], "measureContour", "measureContours")
+funcs.profiler.hook("edit distance", sys.modules[__name__], "editDistance", "editDistances")
+
 ##### Tests ######
-#ensure that all pm codes are readable
-for ltr in lettersCols['letter']:
-    try:
-        letterToPM(ltr).toAMhandshape()
-    except:
-        print("Error with "+ltr+". can't convert from PM notation to AM handshape") 
-        
-#ensure that all articulatory model specifications are readable
-for ltr in lettersCols['letter']:
-    try:
-        letterToArm(ltr)
-    except:
-        print("error with "+ltr+". can't convert from articulatory specifications to AM handshape")
-        
-#ensure that all articulatory model specifications are readable
-for ltr in lettersCols['letter']:
-    try:
-        AMarm = letterToArm(ltr)
-    except:
-        print("error with "+ltr+". can't convert from articulatory specifications to AM handshape")   
-        break
-    try:
-        PMarm = hs.arm(handshape=letterToPM(ltr).toAMhandshape(), orientation=letterCodingCols[ltr]["orientation"])
-    except:
-        print("Error with "+ltr+". can't convert from PM notation to AM handshape")
-        break
-    
-    AMPMdiff = AMarm.toArmTarget()-PMarm.toArmTarget()
-    if AMPMdiff.totalDegreesDifferent() > 0:
-        print("The difference between the PM and AM for "+ltr+" is "+str(AMPMdiff.totalDegreesDifferent())+" degrees.")
-        print("Articulatory model:")
-        print(AMarm.toArmTarget())
-        print("Prosodic model:")
-        print(PMarm.toArmTarget())        
+def checkLetters():
+    """Checks that every letter can be converted from both its articulatory specification and its PM code, and that the two agree"""
+    ensureLetters()
+    #ensure that all pm codes are readable
+    for ltr in lettersCols['letter']:
+        try:
+            letterToPM(ltr).toAMhandshape()
+        except:
+            print("Error with "+ltr+". can't convert from PM notation to AM handshape") 
+
+    #ensure that all articulatory model specifications are readable
+    for ltr in lettersCols['letter']:
+        try:
+            letterToArm(ltr)
+        except:
+            print("error with "+ltr+". can't convert from articulatory specifications to AM handshape")
+
+    #ensure that all articulatory model specifications are readable
+    for ltr in lettersCols['letter']:
+        try:
+            AMarm = letterToArm(ltr)
+        except:
+            print("error with "+ltr+". can't convert from articulatory specifications to AM handshape")   
+            break
+        try:
+            PMarm = hs.arm(handshape=letterToPM(ltr).toAMhandshape(), orientation=letterCodingCols[ltr]["orientation"])
+        except:
+            print("Error with "+ltr+". can't convert from PM notation to AM handshape")
+            break
+
+        AMPMdiff = AMarm.toArmTarget()-PMarm.toArmTarget()
+        if AMPMdiff.totalDegreesDifferent() > 0:
+            print("The difference between the PM and AM for "+ltr+" is "+str(AMPMdiff.totalDegreesDifferent())+" degrees.")
+            print("Articulatory model:")
+            print(AMarm.toArmTarget())
+            print("Prosodic model:")
+            print(PMarm.toArmTarget())
+
+if __name__ == "__main__":
+    checkLetters()
@@ -0,0 +1,174 @@
+"""Streaming motion capture frames and labeling them with the nearest handshapes
+
+Frames of joint angles are read from a csv file (one frame per row, with a header) or a raw
+binary file (one frame after another, every value of the same dtype), a chunk of frames at a
+time, into the order of hc.armLayout. Each chunk is compared with a set of target handshapes
+(the letters by default, see search.handshapeIndex) and the label of, and degrees different
+from, the nearest target is yielded for every frame, so that sessions of any length can be
+labeled in constant memory. Run as a script for the command line interface:
+
+    python mocap.py session.csv -o labels.csv
+    python mocap.py session.bin --binary --fields fields.txt --dtype float32 -o labels.csv
+"""
+import hc
+import search
+
+import argparse, csv, itertools, sys
+import numpy as np
+
+##### Error classes #####
+class mocapError(Exception):
+    pass
+
+##### the layout of the frames #####
+def slotName(slot):
+    """The name of the column for a slot of hc.armLayout, e.g. index.MCP.dfFlex"""
+    return ".".join(slot)
+
+slotNames = dict((slotName(slot), slot) for slot in hc.armLayout)
+
+def fieldMapping(fields, columns=None):
+    """Returns, for every field of a frame, its position in hc.armLayout (or None if it isn't a joint angle)
+
+    Fields are matched with slotName() of the slots, or through columns, a dictionary of
+    field names to slots (or slot names). Slots that no field maps to are nan."""
+    mapping = []
+    for field in fields:
+        slot = field
+        if columns is not None and field in columns:
+            slot = columns[field]
+        if not isinstance(slot, tuple):
+            slot = slotNames.get(slot)
+        if slot is not None and slot not in hc.armIndex:
+            raise mocapError("%s is not a slot of the arm layout." % (str(slot)))
+        mapping.append(None if slot is None else hc.armIndex[slot])
+    if all(position is None for position in mapping):
+        raise mocapError("None of the fields are joint angles: %s" % (", ".join(fields)))
+    return mapping
+
+def framesToArm(values, mapping):
+    """Rearranges an N x fields array of frames into an N x hc.armSize array"""
+    fieldPositions = [i for i, position in enumerate(mapping) if position is not None]
+    armPositions = [mapping[i] for i in fieldPositions]
+    out = np.empty((len(values), hc.armSize))
+    out.fill(np.nan)
+    out[:, armPositions] = values[:, fieldPositions]
+    return out
+
+##### reading frames #####
+def readCSVFrames(fileObj, columns=None, chunkSize=4096):
+    """Yields N x hc.armSize arrays of (up to chunkSize) frames from a csv file with a header
+
+    Empty cells are unspecified (nan)."""
+    reader = csv.reader(fileObj)
+    try:
+        fields = next(reader)
+    except StopIteration:
+        return
+    mapping = fieldMapping(fields, columns)
+    used = [i for i, position in enumerate(mapping) if position is not None]
+    while True:
+        rows = list(itertools.islice(reader, chunkSize))
+        if len(rows) == 0:
+            return
+        values = np.empty((len(rows), len(fields)))
+        values.fill(np.nan)
+        cells = [[row[i] if i < len(row) and row[i] != "" else "nan" for i in used] for row in rows]
+        try:
+            values[:, used] = np.array(cells, dtype=float)
+        except ValueError as e:
+            raise mocapError("Frames need to be numbers: %s" % (e))
+        yield framesToArm(values, mapping)
+
+def readBinaryFrames(fileObj, fields, dtype="<f4", columns=None, chunkSize=4096):
+    """Yields N x hc.armSize arrays of (up to chunkSize) frames from a raw binary file
+
+    Every frame is len(fields) values of dtype, in the order of fields (see fieldMapping).
+    nan values are unspecified."""
+    dtype = np.dtype(dtype)
+    mapping = fieldMapping(fields, columns)
+    frameBytes = dtype.itemsize * len(fields)
+    while True:
+        data = fileObj.read(frameBytes * chunkSize)
+        if len(data) == 0:
+            return
+        if len(data) % frameBytes != 0:
+            raise mocapError("The file ends part way through a frame.")
+        values = np.frombuffer(data, dtype=dtype).reshape(-1, len(fields)).astype(float)
+        yield framesToArm(values, mapping)
+
+##### labeling #####
+def labelChunk(angles, index):
+    """The label of, and degrees different from, the nearest target in index for every frame of an N x hc.armSize array"""
+    if index.size == hc.handSize:
+        angles = angles[:, hc.wristSize:]
+    distances = index.blockDistances(angles)
+    rows = np.argmin(distances, axis=1)
+    labels = [index.labels[row][0] for row in rows]
+    return labels, distances[np.arange(len(rows)), rows]
+
+def labelFrames(chunks, index=None, method="unweighted", blockSize=None):
+    """Yields (labels, distances), lists of the nearest target's label and an array of the degrees different, for every chunk of frames
+
+    index is a search.handshapeIndex of the targets (the hand configurations of the letters by
+    default). Chunks are compared blockSize frames at a time (by default as many as keep a
+    block to about a million degrees of freedom)."""
+    if index is None:
+        index = search.letterSearchIndex(method)
+    if len(index.angles) == 0:
+        raise mocapError("There are no targets in the index to label the frames with.")
+    if blockSize is None:
+        blockSize = max(1, 2**20 // (len(index.angles)*index.size))
+    for angles in chunks:
+        labels = []
+        distances = []
+        for start in range(0, len(angles), blockSize):
+            blockLabels, blockDistances = labelChunk(angles[start:start+blockSize], index)
+            labels.extend(blockLabels)
+            distances.append(blockDistances)
+        yield labels, np.concatenate(distances) if distances else np.zeros(0)
+
+def writeLabels(labeled, fileObj):
+    """Writes frame, label, distance rows as csv with a header, returns the number of frames"""
+    writer = csv.writer(fileObj)
+    writer.writerow(["frame", "label", "distance"])
+    frame = 0
+    for labels, distances in labeled:
+        for label, distance in zip(labels, distances):
+            writer.writerow([frame, label, hc.number(distance)])
+            frame += 1
+    return frame
+
+##### command line interface #####
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Label every frame of a motion capture session with the nearest letter handshape.")
+    parser.add_argument("input", help="csv (with a header) or raw binary file of frames")
+    parser.add_argument("-o", "--output", default="-", help="csv file to write the labels to (default: stdout)")
+    parser.add_argument("--binary", action="store_true", help="the input is raw binary frames")
+    parser.add_argument("--fields", default=None, help="for binary input, a file with the name of every field of a frame, one per line")
+    parser.add_argument("--dtype", default="<f4", help="for binary input, the type of the values (default: <f4)")
+    parser.add_argument("-m", "--method", default="unweighted", choices=("unweighted", "weighted"), help="how to measure degrees different (default: unweighted)")
+    parser.add_argument("--chunk-size", type=int, default=4096, help="number of frames read at a time (default: 4096)")
+    args = parser.parse_args(args)
+
+    if args.binary:
+        if args.fields is None:
+            parser.error("binary input needs --fields")
+        with open(args.fields) as fieldsFile:
+            fields = [line.strip() for line in fieldsFile if line.strip()]
+        inFile = open(args.input, "rb")
+        chunks = readBinaryFrames(inFile, fields, args.dtype, chunkSize=args.chunk_size)
+    else:
+        inFile = open(args.input, "r")
+        chunks = readCSVFrames(inFile, chunkSize=args.chunk_size)
+    outFile = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        frames = writeLabels(labelFrames(chunks, method=args.method), outFile)
+    finally:
+        inFile.close()
+        if outFile is not sys.stdout:
+            outFile.close()
+    sys.stderr.write("Labeled %s frames.\n" % (frames))
+
+if __name__ == "__main__":
+    main()
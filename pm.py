@@ -1,28 +1,113 @@
 import hs
 import funcs
-import csv
-from os import path
+import csv, re, sys
 
 class notationError(Exception):
     pass
 
-fingerCodingKeyFile =path.join(funcs.resources_dir,'fingerCodingKey.csv')
-fingerCodingKey = funcs.read_csv_data(fingerCodingKeyFile)
-fingerCodingCols = funcs.dictToCols(fingerCodingKey)
-bsfingerCodingCols = funcs.dictColMapper(fingerCodingKey, "base symbol")
+##### coding keys for the notation, read from the csvs the first time they are needed #####
+# resources (see funcs.resourceData)
+fingerCodingKeyFile = 'fingerCodingKey.csv'
+jointCodingKeyFile = 'jointCodingKey.csv'
+abdCodingKeyFile = 'abdCodingKey.csv'
+codingKeysLoaded = False
 
-jointCodingKeyFile =path.join(funcs.resources_dir,'jointCodingKey.csv')
-jointCodingKey = funcs.read_csv_data(jointCodingKeyFile)
-jointCodingCols = funcs.dictToCols(jointCodingKey)
-psfjointCodingCols = funcs.dictColMapper(jointCodingKey, "psf")
-ssfjointCodingCols = funcs.dictColMapper(jointCodingKey, "ssf")
-nsfjointCodingCols = funcs.dictColMapper(jointCodingKey, "nsf")
+def buildCodingKeys(fingerData, jointData, abdData):
+    """Builds the lookup tables of the coding keys from the bytes of their csvs"""
+    tables = {}
+    tables["fingerCodingKey"] = fingerCodingKey = funcs.resourceCSV(fingerData)
+    tables["fingerCodingCols"] = funcs.dictToCols(fingerCodingKey)
+    tables["bsfingerCodingCols"] = funcs.dictColMapper(fingerCodingKey, "base symbol")
 
-abdCodingKeyFile = path.join(funcs.resources_dir,'abdCodingKey.csv')
-abdCodingKey = funcs.read_csv_data(abdCodingKeyFile)
-abdCodingCols = funcs.dictToCols(abdCodingKey)
-psfabdCodingCols = funcs.dictColMapper(abdCodingKey, "psf")
-ssfabdCodingCols = funcs.dictColMapper(abdCodingKey, "psf") #ssf is the same as the psf for abduction.
+    tables["jointCodingKey"] = jointCodingKey = funcs.resourceCSV(jointData)
+    tables["jointCodingCols"] = funcs.dictToCols(jointCodingKey)
+    tables["psfjointCodingCols"] = funcs.dictColMapper(jointCodingKey, "psf")
+    tables["ssfjointCodingCols"] = funcs.dictColMapper(jointCodingKey, "ssf")
+    tables["nsfjointCodingCols"] = funcs.dictColMapper(jointCodingKey, "nsf")
+
+    tables["abdCodingKey"] = abdCodingKey = funcs.resourceCSV(abdData)
+    tables["abdCodingCols"] = funcs.dictToCols(abdCodingKey)
+    tables["psfabdCodingCols"] = funcs.dictColMapper(abdCodingKey, "psf")
+    tables["ssfabdCodingCols"] = funcs.dictColMapper(abdCodingKey, "psf") #ssf is the same as the psf for abduction.
+    return tables
+
+def loadCodingKeys():
+    """(Re)reads the coding keys for the notation system"""
+    global fingerCodingKey, fingerCodingCols, bsfingerCodingCols
+    global jointCodingKey, jointCodingCols, psfjointCodingCols, ssfjointCodingCols, nsfjointCodingCols
+    global abdCodingKey, abdCodingCols, psfabdCodingCols, ssfabdCodingCols
+    global codingKeysLoaded
+    tables = buildCodingKeys(*[funcs.resourceData(keyFile) for keyFile in (fingerCodingKeyFile, jointCodingKeyFile, abdCodingKeyFile)])
+    fingerCodingKey = tables["fingerCodingKey"]
+    fingerCodingCols = tables["fingerCodingCols"]
+    bsfingerCodingCols = tables["bsfingerCodingCols"]
+
+    jointCodingKey = tables["jointCodingKey"]
+    jointCodingCols = tables["jointCodingCols"]
+    psfjointCodingCols = tables["psfjointCodingCols"]
+    ssfjointCodingCols = tables["ssfjointCodingCols"]
+    nsfjointCodingCols = tables["nsfjointCodingCols"]
+
+    abdCodingKey = tables["abdCodingKey"]
+    abdCodingCols = tables["abdCodingCols"]
+    psfabdCodingCols = tables["psfabdCodingCols"]
+    ssfabdCodingCols = tables["ssfabdCodingCols"]
+    compileNotation()
+    codingKeysLoaded = True
+
+def ensureCodingKeys():
+    """Reads the coding keys if they haven't been read yet"""
+    if not codingKeysLoaded:
+        loadCodingKeys()
+
+# the tables are read the first time one of them is used
+funcs.lazyTables(sys.modules[__name__], ("fingerCodingKey", "fingerCodingCols", "bsfingerCodingCols",
+                                         "jointCodingKey", "jointCodingCols", "psfjointCodingCols", "ssfjointCodingCols", "nsfjointCodingCols",
+                                         "abdCodingKey", "abdCodingCols", "psfabdCodingCols", "ssfabdCodingCols"), ensureCodingKeys)
+
+##### the notation parser, compiled from the coding keys #####
+# Interned parses of the most recently parsed whole codes, see parse()
+parseCache = funcs.conversionCache("pm.parse", maxSize=100000)
+
+def symbolClass(symbols):
+    """Returns a regular expression character class matching the single character symbols"""
+    return "[%s]" % "".join(re.escape(symbol) for symbol in sorted(symbols) if len(symbol) == 1)
+
+def compileNotation():
+    """Compiles the parser for the notation from the coding keys, and clears the interned parses
+
+    Only single character symbols can be used in a code: selected and secondary selected fingers
+    are a base symbol and/or the thumb (T), optionally followed by opposition (-), an abduction
+    symbol and a joint symbol. Nonselected fingers are a single joint symbol."""
+    global fingersPattern, baseSymbols, nsfSymbols
+    baseSymbols = frozenset(fingerCodingCols["base symbol"])
+    nsfSymbols = frozenset(jointCodingCols["nsf"])
+    fingersPattern = re.compile("(?P<fing>%s)?(?P<thumb>T)?(?P<oppos>-)?(?P<abd>%s)?(?P<joint>%s)?" % (
+        symbolClass(baseSymbols - set("T")),
+        symbolClass(abdCodingCols["psf"]),
+        symbolClass(jointCodingCols["psf"])), re.IGNORECASE)
+    parseCache.clear()
+
+def parseFingers(fingers, string, name):
+    """Sets the fing, thumb, oppos, abd and joint attributes of fingers from a (secondary) selected fingers string"""
+    if string[:1].upper() not in baseSymbols:
+        raise notationError("Unknown base symbol in %ss" % (name))
+    match = fingersPattern.match(string)
+    if match.end() != len(string):
+        if match.group("joint"):
+            raise notationError("There's still unparsed string left in the %s substring." % (name))
+        raise notationError("Unknown joint symbol in %ss" % (name))
+    fing, thumb, oppos, abd, joint = match.group("fing", "thumb", "oppos", "abd", "joint")
+    fingers.fing = fing and fing.upper()
+    fingers.thumb = thumb and thumb.upper()
+    fingers.oppos = oppos
+    fingers.abd = abd and abd.lower()
+    fingers.joint = joint and joint.lower()
+
+def parse(string):
+    """Returns the pmHandshape for string, interned so that repeated codes share one (read only) parse"""
+    ensureCodingKeys()
+    return parseCache.get(string, lambda: pmHandshape(string))
 
 def shortToMember(string):
     map = {'I': 'index',
@@ -38,165 +123,51 @@ def shortToMember(string):
 class selectedFingers:
     """a class for selected fingers based on the PM notation system in Eccarius and Brentari 2008 of the type 1T-^@;1T-@;#"""
     def __init__(self, string):
-        stringList = list(string)
-        
-        # Selected finger symbols
-        # fingers
-        symbolUp = stringList.pop(0).upper()
-        if symbolUp not in set(fingerCodingCols["base symbol"]):
-            raise notationError("Unknown base symbol in selected fingers")
-        else:
-            if symbolUp != "T":
-                self.fing = symbolUp
-		try:
-                    symbolUp = stringList.pop(0)
-                except IndexError:
-                    symbolUp = None
-            else:
-                self.fing = None
-        # thumb
-        if symbolUp: symbolUp = symbolUp.upper()
-        if symbolUp != "T":
-            self.thumb = None
-        else:
-            self.thumb = symbolUp
-            try:
-                symbolUp = stringList.pop(0)
-            except IndexError:
-                symbolUp = None
-        # opposition
-        if symbolUp != "-":
-            self.oppos = None
-        else:
-            self.oppos = symbolUp
-            try:
-                symbolUp = stringList.pop(0)
-            except IndexError:
-                symbolUp = None
-        # abduction
-        if symbolUp: symbolUp = symbolUp.lower()                
-        if symbolUp not in set(abdCodingCols["psf"]):
-            self.abd = None
-        else:
-            self.abd = symbolUp
-            try:
-                symbolUp = stringList.pop(0)
-            except IndexError:
-                symbolUp = None
-        # joint
-        if symbolUp: symbolUp = symbolUp.lower()                
-        if symbolUp not in set(jointCodingCols["psf"]):
-            if symbolUp == None:
-                self.joint = None
-            else:
-                raise notationError("Unknown joint symbol in selected fingers")
-        else:
-            self.joint = symbolUp
-        # test to ensure there's no string left.
-        if len(stringList) > 0:
-            raise notationError("There's still unparsed string left in the selected finger substring.")
+        ensureCodingKeys()
+        parseFingers(self, string, "selected finger")
 
 class secondarySelectedFingers:
     """a class for secondary selected fingers based on the PM notation system in Eccarius and Brentari 2008 of the type 1T-^@;1T-@;#"""
     def __init__(self, string):
-        stringList = list(string)
-        # Secondary selected finger symbols
-        # fingers
-        symbolUp = stringList.pop(0).upper()
-        if symbolUp not in set(fingerCodingCols["base symbol"]):
-            raise notationError("Unknown base symbol in selected fingers")
-        else:
-            if symbolUp != "T":
-                self.fing = symbolUp
-		try:
-                    symbolUp = stringList.pop(0)
-                except IndexError:
-                    symbolUp = None
-            else:
-                self.fing = None
-        # thumb
-        if symbolUp: symbolUp = symbolUp.upper()                
-        if symbolUp != "T":
-            self.thumb = None
-        else:
-            self.thumb = symbolUp
-            try:
-                symbolUp = stringList.pop(0)
-            except IndexError:
-                symbolUp = None
-        # opposition
-        if symbolUp != "-":
-            self.oppos = None
-        else:
-            self.oppos = symbolUp
-            try:
-                symbolUp = stringList.pop(0)
-            except IndexError:
-                symbolUp = None
-        # abduction doesn't exist in PM notation for secondary selected fingers, but should be and is accounted for here.
-        if symbolUp: symbolUp = symbolUp.lower()                
-        if symbolUp not in set(abdCodingCols["psf"]):
-            self.abd = None
-        else:
-            self.abd = symbolUp
-            try:
-                symbolUp = stringList.pop(0)
-            except IndexError:
-                symbolUp = None
-        # joint
-        if symbolUp: symbolUp = symbolUp.lower()                
-        if symbolUp not in set(jointCodingCols["psf"]):
-            if symbolUp == None:
-                self.joint = None
-            else:
-                raise notationError("Unknown joint symbol in secondary selected fingers")
-        else:
-            self.joint = symbolUp
-        # test to ensure there's no string left.
-        if len(stringList) > 0:
-            raise notationError("There's still unparsed string left in the secondary selected finger substring.")
+        ensureCodingKeys()
+        parseFingers(self, string, "secondary selected finger")
 
 class nonSelectedFingers:
     """a class for non selected fingers based on the PM notation system in Eccarius and Brentari 2008 of the type 1T-^@;1T-@;#"""
     def __init__(self, string):
-        stringList = list(string)
-        # joint
-        symbolUp = stringList.pop(0)
-        if symbolUp not in set(jointCodingCols["nsf"]):
-            if symbolUp is None:
-                self.joint = None
-            else:
-                raise notationError("Unknown joint symbol in nonselected fingers")
-        else:
-            self.joint = symbolUp
+        ensureCodingKeys()
+        if len(string) == 0 or string[:1] not in nsfSymbols:
+            raise notationError("Unknown joint symbol in nonselected fingers")
+        self.joint = string[:1]
         # test to ensure there's no string left.
-        if len(stringList) > 0:
+        if len(string) > 1:
             raise notationError("There's still unparsed string left in the nonselected finger substring.")
 
 class pmHandshape:
     """a class based on the PM notation system in Eccarius and Brentari 2008 of the type 1T-^@;1T-@;#"""
     def __init__(self, string):
+        ensureCodingKeys()
         strings = string.split(";")
         self.SF = selectedFingers(strings.pop(0))
-        try:
+        self.SSF = None
+        self.NSF = None
+        # an empty substring (e.g. a trailing ;) leaves the nonselected fingers unspecified
+        if len(strings) > 0:
             stringUp = strings.pop(0)
-            if stringUp in set(jointCodingCols["nsf"]):
-                self.SSF = None
-                self.NSF = nonSelectedFingers(stringUp)
+            if stringUp in nsfSymbols:
+                if stringUp:
+                    self.NSF = nonSelectedFingers(stringUp)
             else:
                 self.SSF = secondarySelectedFingers(stringUp)
-                try:
+                if len(strings) > 0:
                     stringUp = strings.pop(0)
-                    self.NSF = nonSelectedFingers(stringUp)
-                except IndexError:
-                    self.NSF = None
-        except IndexError:
-            self.SSF = None
-            self.NSF = None
+                    if stringUp:
+                        self.NSF = nonSelectedFingers(stringUp)
         if len(strings) > 0:
             raise notationError("There's still unparsed string left: "+str(strings))
             
     def toAMhandshape(self):
+        ensureCodingKeys()
         # set default value for the thumb: opposed
         oppos = "opposed"
         # translate the selected fingers        
@@ -261,12 +232,17 @@ class pmHandshape:
         AMhandshape = hs.handshape(selectedFingers = sf, secondarySelectedFingers = ssf, thumb = thumb, nonSelectedFingers = nsf )
         return AMhandshape
 
+##### instrumentation, see funcs.profiler #####
+funcs.profiler.hook("parse", pmHandshape, "__init__")
+funcs.profiler.hook("pm to am", pmHandshape, "toAMhandshape")
+
 ##### test #####
-foo = pmHandshape("1;#")
-bar = foo.toAMhandshape()
-baz = bar.toHandconfigTarget()
+if __name__ == "__main__":
+    foo = pmHandshape("1;#")
+    bar = foo.toAMhandshape()
+    baz = bar.toHandconfigTarget()
 
-foo1 = pmHandshape("DT@;/")
-bar1 = foo1.toAMhandshape()
+    foo1 = pmHandshape("DT@;/")
+    bar1 = foo1.toAMhandshape()
 
-baz1 = bar1.toHandconfigTarget()
+    baz1 = bar1.toHandconfigTarget()
@@ -0,0 +1,318 @@
+"""A compact binary format for arm configurations and handshapes
+
+A record file is a short header followed by fixed width records, one after another, so a file
+of any size can be memory mapped and read as an array without parsing (or copying) anything.
+There are two kinds of records:
+
+    arm        the angles of an hc.armconfiguration, in the order of hc.armLayout, and a bit
+               mask of the degrees of freedom that are specified (bit i for armLayout[i])
+    handshape  the code of an hs.handshape in a space.handshapeSpace (the space is in the header)
+
+The header is the magic string, a format version (uint16), the length of the whole header
+(uint32, padded so that the records are aligned) and json with the kind, the numpy description
+of a record and the layout (or space) the records are in. The number of records follows from
+the size of the file, so files can be appended to (with append=True, the header already in the
+file is checked and kept):
+
+    with records.recordWriter("frames.amr", "arm") as writer:
+        writer.write(angles)
+    with records.recordWriter("frames.amr", "arm", append=True) as writer:
+        writer.write(moreAngles)
+    frames = records.recordFile("frames.amr")
+    frames.angles(0, 1000)
+"""
+import hc
+import space
+
+import json, mmap, os, struct
+import numpy as np
+from os import path
+
+##### Error classes #####
+class recordError(Exception):
+    pass
+
+##### the format #####
+magic = b"AMOHSREC"
+version = 1
+headerStruct = struct.Struct("<8sHI")
+# the records start at a multiple of this
+alignment = 64
+
+kinds = ("arm", "handshape")
+
+# bit i of an arm record's mask is set if hc.armLayout[i] is specified
+maskBits = np.left_shift(np.uint32(1), np.arange(hc.armSize, dtype=np.uint32))
+
+def armDtype(angleType="<f4"):
+    """The dtype of an arm record, with angles of angleType (a float, or integer for whole degrees)"""
+    angleType = np.dtype(angleType)
+    if angleType.kind not in "fi":
+        raise recordError("Angles need to be stored as floats or integers, not %s." % (angleType))
+    return np.dtype([("angles", angleType, (hc.armSize,)), ("mask", "<u4")])
+
+handshapeDtype = np.dtype([("code", "<i8")])
+
+def layoutNames():
+    return [".".join(slot) for slot in hc.armLayout]
+
+def encodeHeader(kind, dtype, extra):
+    """The bytes of a header for records of kind and dtype, extra is added to the json"""
+    info = dict(extra, kind=kind, descr=dtype.descr)
+    text = json.dumps(info, sort_keys=True).encode("utf-8")
+    length = headerStruct.size + len(text) + 1
+    length += -length % alignment
+    return headerStruct.pack(magic, version, length) + text + b" "*(length - headerStruct.size - len(text) - 1) + b"\n"
+
+def decodeHeader(buf):
+    """Returns the json of the header at the start of buf (a uint8 array), and where the records start"""
+    if len(buf) < headerStruct.size:
+        raise recordError("The file is too short to be a record file.")
+    fileMagic, fileVersion, length = headerStruct.unpack(buf[:headerStruct.size].tobytes())
+    if fileMagic != magic:
+        raise recordError("This is not a record file.")
+    if fileVersion != version:
+        raise recordError("Record files of version %s can't be read, only version %s." % (fileVersion, version))
+    try:
+        info = json.loads(buf[headerStruct.size:length].tobytes().decode("utf-8"))
+    except ValueError:
+        raise recordError("The header of the record file is damaged.")
+    if info.get("kind") not in kinds:
+        raise recordError("Unknown kind of records: %s" % (info.get("kind")))
+    return info, length
+
+def recordDtype(descr):
+    """The dtype of a header's description (json turns the tuples of numpy descriptions into lists)"""
+    return np.dtype([tuple(tuple(part) if isinstance(part, list) else str(part) for part in field) for field in descr])
+
+def headerSpace(spec):
+    """The space.handshapeSpace of a header's spec (json turns its strings into unicode)"""
+    return space.handshapeSpace(joints=[str(joint) for joint in spec["joints"]], abductions=[str(abd) for abd in spec["abductions"]],
+                                oppositions=[str(oppos) for oppos in spec["oppositions"]], secondary=spec["secondary"],
+                                nonSelected=spec["nonSelected"])
+
+##### converting #####
+def anglesToRecords(angles, dtype):
+    """Packs an N x hc.armSize array of angles (nan for unspecified degrees of freedom) into arm records"""
+    angles = np.asarray(angles, dtype=float)
+    specified = ~np.isnan(angles)
+    out = np.zeros(len(angles), dtype=dtype)
+    if dtype["angles"].base.kind == "i":
+        out["angles"] = np.rint(np.where(specified, angles, 0))
+    else:
+        out["angles"] = np.where(specified, angles, 0)
+    out["mask"] = (specified * maskBits).sum(axis=1, dtype=np.uint32)
+    return out
+
+def recordsToAngles(records):
+    """Unpacks arm records into an N x hc.armSize array of angles, with nan for unspecified degrees of freedom"""
+    angles = records["angles"].astype(float)
+    angles[(records["mask"][:, np.newaxis] & maskBits) == 0] = np.nan
+    return angles
+
+##### writing #####
+class recordWriter(object):
+    """Writes records of kind ("arm" or "handshape") to fileObj, a file name or a file opened for binary writing
+
+    Arm angles are stored as angleType (<f4 by default); handshapes as their codes in
+    handshapeSpace (the whole space by default). With append the records are added to the end of
+    an existing file (fileObj has to be opened for reading and writing), which has to have the
+    same kind of records in the same dtype and layout (or space); a new or empty file gets a
+    header as usual. count is the number of records in the file. Use as a context manager, or
+    call close() when done."""
+    def __init__(self, fileObj, kind="arm", angleType=None, handshapeSpace=None, append=False):
+        if kind not in kinds:
+            raise recordError("Records can be of the kinds %s, not %s." % (", ".join(kinds), kind))
+        self.kind = kind
+        self.ownsFile = not hasattr(fileObj, "write")
+        if self.ownsFile:
+            append = append and path.exists(fileObj)
+            self.fileObj = open(fileObj, "r+b" if append else "wb")
+        else:
+            self.fileObj = fileObj
+        try:
+            info = self.readHeader() if append else None
+            if info is None:
+                self.newHeader(angleType, handshapeSpace)
+            else:
+                self.checkHeader(info, angleType, handshapeSpace)
+        except:
+            if self.ownsFile:
+                self.fileObj.close()
+            raise
+
+    def newHeader(self, angleType, handshapeSpace):
+        if self.kind == "arm":
+            self.dtype = armDtype("<f4" if angleType is None else angleType)
+            extra = {"layout": layoutNames()}
+        else:
+            self.dtype = handshapeDtype
+            self.space = space.handshapeSpace() if handshapeSpace is None else handshapeSpace
+            extra = {"space": self.space.spec()}
+        self.fileObj.write(encodeHeader(self.kind, self.dtype, extra))
+        self.count = 0
+
+    def readHeader(self):
+        """The json of the header of the file being appended to, None if the file is empty"""
+        self.fileObj.seek(0, 2)
+        self.fileSize = self.fileObj.tell()
+        if self.fileSize == 0:
+            return None
+        self.fileObj.seek(0)
+        start = self.fileObj.read(headerStruct.size)
+        if len(start) < headerStruct.size:
+            raise recordError("The file is too short to be a record file.")
+        length = headerStruct.unpack(start)[2]
+        self.fileObj.seek(0)
+        info, self.headerSize = decodeHeader(np.frombuffer(self.fileObj.read(length), dtype=np.uint8))
+        return info
+
+    def checkHeader(self, info, angleType, handshapeSpace):
+        """Checks that the records of the file being appended to are the ones this writer writes, and moves to the end of the file"""
+        if info["kind"] != self.kind:
+            raise recordError("Can't append %s records to a file of %s records." % (self.kind, info["kind"]))
+        self.dtype = recordDtype(info["descr"])
+        if self.kind == "arm":
+            if info.get("layout") != layoutNames():
+                raise recordError("The arm records are in a different layout than hc.armLayout.")
+            if angleType is not None and armDtype(angleType) != self.dtype:
+                raise recordError("The file stores angles as %s, not %s." % (self.dtype["angles"].base.str, np.dtype(angleType).str))
+        else:
+            if handshapeSpace is not None and handshapeSpace.spec() != info["space"]:
+                raise recordError("The file stores handshapes in a different space.")
+            self.space = headerSpace(info["space"]) if handshapeSpace is None else handshapeSpace
+        size = self.fileSize - self.headerSize
+        if size < 0 or size % self.dtype.itemsize != 0:
+            raise recordError("The record file ends part way through a record.")
+        self.count = size // self.dtype.itemsize
+        self.fileObj.seek(0, 2)
+
+    def write(self, items):
+        """Writes a batch of records
+
+        For arm records items is an N x hc.armSize array or an iterable of arm configurations (or
+        hs.arms); for handshape records an array of codes or an iterable of hs.handshapes."""
+        if self.kind == "arm":
+            out = anglesToRecords(hc.armsToArray(items), self.dtype)
+        elif isinstance(items, np.ndarray):
+            out = np.zeros(len(items), dtype=self.dtype)
+            out["code"] = items
+        else:
+            out = np.array([(self.space.code(handshape),) for handshape in items], dtype=self.dtype)
+        self.fileObj.write(out.tobytes())
+        self.count += len(out)
+        return len(out)
+
+    def close(self):
+        if self.ownsFile:
+            self.fileObj.close()
+        else:
+            self.fileObj.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+def writeArms(fileObj, arms, angleType=None, append=False):
+    """Writes arm configurations (an N x hc.armSize array, or an iterable) to a record file, returns the number written"""
+    with recordWriter(fileObj, "arm", angleType, append=append) as writer:
+        return writer.write(arms)
+
+def writeHandshapes(fileObj, handshapes, handshapeSpace=None, append=False):
+    """Writes handshapes (an array of codes, or an iterable of hs.handshapes) to a record file, returns the number written"""
+    with recordWriter(fileObj, "handshape", handshapeSpace=handshapeSpace, append=append) as writer:
+        return writer.write(handshapes)
+
+##### reading #####
+class recordFile(object):
+    """The records of a record file, read without copying
+
+    The records are read from fileName, which is memory mapped (read only), or from buffer,
+    anything np.frombuffer can read (bytes or an mmap). records is a structured array over the
+    records; angles() and codes() return arrays of many records, and indexing or iterating
+    builds the objects (hc.armconfigurations or hs.handshapes) one at a time."""
+    def __init__(self, fileName=None, buffer=None):
+        if fileName is not None:
+            with open(fileName, "rb") as fileObj:
+                # an empty file can't be memory mapped
+                if os.fstat(fileObj.fileno()).st_size == 0:
+                    raise recordError("%s is empty, not a record file." % (fileName))
+                buffer = mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ)
+        elif buffer is None:
+            raise recordError("Records need to be read from a file name or a buffer.")
+        self.buffer = buffer
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        self.info, start = decodeHeader(data)
+        self.kind = self.info["kind"]
+        self.dtype = recordDtype(self.info["descr"])
+        size = len(data) - start
+        if size < 0 or size % self.dtype.itemsize != 0:
+            raise recordError("The record file ends part way through a record.")
+        self.records = np.frombuffer(self.buffer, dtype=self.dtype, count=size // self.dtype.itemsize, offset=start)
+        self.space = None
+        if self.kind == "arm":
+            if self.info.get("layout") != layoutNames():
+                raise recordError("The arm records are in a different layout than hc.armLayout.")
+        else:
+            self.space = headerSpace(self.info["space"])
+
+    def __len__(self):
+        return len(self.records)
+
+    def angles(self, start=0, stop=None):
+        """The angles of records start to stop, an N x hc.armSize array (hc.handSize for handshapes) with nan for unspecified degrees of freedom"""
+        if self.kind == "arm":
+            return recordsToAngles(self.records[start:stop])
+        return self.space.angles(self.codes(start, stop))[0]
+
+    def mask(self, start=0, stop=None):
+        """Which degrees of freedom of records start to stop are specified, an N x hc.armSize boolean array"""
+        if self.kind != "arm":
+            raise recordError("Only arm records have masks.")
+        return (self.records["mask"][start:stop, np.newaxis] & maskBits) != 0
+
+    def codes(self, start=0, stop=None):
+        """The codes of handshape records start to stop (a copy, so that it outlives close())"""
+        if self.kind != "handshape":
+            raise recordError("Only handshape records have codes.")
+        return self.records["code"][start:stop].copy()
+
+    def chunks(self, chunkSize=4096):
+        """Yields the angles of chunkSize records at a time (see mocap.labelFrames)"""
+        for start in range(0, len(self), chunkSize):
+            yield self.angles(start, start+chunkSize)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("There is no record %s, there are %s records." % (i, len(self)))
+        if self.kind == "arm":
+            return hc.armconfiguration.fromArray(recordsToAngles(self.records[i:i+1])[0])
+        return self.space.handshape(int(self.records["code"][i]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        """Unmaps the file
+
+        Only records is a view of the file, the arrays of the other methods are copies. If records
+        is still in use elsewhere the file is unmapped once it is gone (python 2 can't tell, so
+        don't use records after close() there)."""
+        self.records = None
+        buffer, self.buffer = self.buffer, None
+        if isinstance(buffer, mmap.mmap):
+            try:
+                buffer.close()
+            except BufferError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
@@ -1,18 +1,30 @@
 import hc
 import funcs
-import string # for testing
-import letters # for testing
+import letters
 
-import yaml, csv, math, subprocess
+import yaml, csv, math, re, subprocess, copy, os, tempfile, errno, hashlib, shutil, sys, time
+import multiprocessing
+import numpy as np
+from multiprocessing import util
 from os import path, makedirs
 
 ##### Error classes #####
 class specificationError(Exception):
     pass
 
+class poseFormatError(Exception):
+    """A pose that the pose reader or writer can't handle, which yaml is used for instead"""
+    pass
+
 ##### Path to deafult in the base pose to alter #####
 baseHCposeFile = path.join(funcs.resources_dir,"fsBaseOpticalClosedToOpen.yml")
 
+##### Paths to the renderer, its scene and its temporary files #####
+imageGen = path.join(funcs.resources_dir,"imageGen")
+sceneSpecFile = path.join(funcs.resources_dir,"hand_model/scene_spec.yml")
+tmpDir = path.join(funcs.resources_dir,"tmp")
+cacheDir = path.join(funcs.resources_dir,"cache")
+
 ##### Establish joint angles for the base hand #####
 index = hc.finger(MCP=(180,5), PIP=180, DIP=180)
 middle = hc.finger(MCP=(180,2), PIP=180, DIP=180)
@@ -29,91 +41,698 @@ def ntz(value):
         value = 0
     return value
     
-def renderImage(hc, imageOutFile, baseHCposeFile=baseHCposeFile, baseHC=baseHC):
-    ##### Read in the base pose to alter #####
-    baseHCposefile = open(baseHCposeFile, "r")
-    baseHCpose = yaml.load(baseHCposefile)
-    baseHCposefile.close()
+##### pose files #####
+# The first line of every pose that imageGen reads
+poseHeader = "%YAML:1.0"
 
-    newHCpose = baseHCpose
-    diff = baseHC - hc
-    
-    fingMap = {"finger4": 'index',
-              "finger3": 'middle',
-              "finger2": 'ring',
-              "finger1": 'pinky',
-              "finger5": 'thumb'}
-              
-    fingerJointMap = {"joint1": 'MCP',
-                "joint2": 'PIP',
-                "joint3": 'DIP'}
-
-    thumbJointMap = {"joint1": 'CM',
-                "joint2": 'MCP',
-                "joint3": 'IP'}
-    
-    for fingerJoint in baseHCpose['hand_joints']:
-        finger = fingerJoint[0:7]
-        joint = fingerJoint[7:13]
-        if finger[0:-1] != "finger" or joint[0:-1] != "joint":
+# the loader that yaml.load uses by default
+poseLoader = getattr(yaml, "FullLoader", yaml.Loader)
+
+# Pose files that have been read, keyed by their path, modification time and size
+poseFileCache = funcs.conversionCache("render.poseFiles")
+
+def loadPose(poseFile):
+    """Reads a pose file, only parsing it again if it has changed"""
+    stat = os.stat(poseFile)
+    def read():
+        with open(poseFile, "r") as poseFileObj:
+            return readPose(poseFileObj.read())
+    # the cached pose is copied, so that changing the pose doesn't change the cache
+    return copy.deepcopy(poseFileCache.get((path.abspath(poseFile), stat.st_mtime, stat.st_size), read))
+
+def readPose(text):
+    """Parses the text of a pose (one pose, with or without the %YAML:1.0 line)
+
+    Poses written by writePose are read directly, anything else is read with yaml."""
+    lines = text.splitlines()
+    if lines and lines[0].strip() == poseHeader:
+        try:
+            return parseBlock(lines, 1)[0]
+        except poseFormatError:
+            lines = lines[1:]
+    return yaml.load("\n".join(lines), Loader=poseLoader)
+
+def readPoses(text):
+    """Parses a stream of poses (see writePoses), returns a list of poses"""
+    poses = []
+    pose = None
+    for line in text.splitlines(True):
+        if line.strip() == poseHeader:
+            if pose is not None:
+                poses.append(readPose("".join(pose)))
+            pose = []
+        if pose is None:
+            raise poseFormatError("A pose stream needs to start with %s." % (poseHeader))
+        pose.append(line)
+    if pose is not None:
+        poses.append(readPose("".join(pose)))
+    return poses
+
+# the scalars that poses are made of, as yaml writes them
+intPattern = re.compile(r"^-?(?:0|[1-9][0-9]*)$")
+floatPattern = re.compile(r"^-?[0-9]+\.[0-9]+(?:e[-+][0-9]+)?$")
+keyPattern = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# the other scalars that have been read (or written)
+scalarsRead = {}
+scalarsWritten = {}
+
+def parseScalar(token):
+    if floatPattern.match(token):
+        return float(token)
+    if intPattern.match(token):
+        return int(token)
+    try:
+        return scalarsRead[token]
+    except KeyError:
+        try:
+            value = yaml.load(token, Loader=poseLoader)
+        except yaml.YAMLError:
+            raise poseFormatError("%s is not a whole scalar." % (token))
+        if isinstance(value, (dict, list)):
+            raise poseFormatError("%s is not a scalar." % (token))
+        scalarsRead[token] = value
+        return value
+
+def parseBlock(lines, start, indent=0):
+    """Parses the block style mapping that starts at lines[start], returns it and where it ends
+
+    Only mappings of mappings, sequences and scalars, as writePose writes them, can be parsed."""
+    out = {}
+    i = start
+    while i < len(lines):
+        line = lines[i]
+        content = line.lstrip(" ")
+        if content == "":
+            i += 1
             continue
-            
-        if fingMap[finger] == "thumb":
-            jointMove = getattr(getattr(diff.hand, fingMap[finger]), thumbJointMap[joint])
-            if joint == "joint1":
-                # these joint mappings are wrong wrong wrong.
-                jointMatrix = [(ntz(jointMove.dfFlex)*math.pi)/180, (ntz(jointMove.dfAbd)*math.pi)/180 , (ntz(jointMove.dfRot)*math.pi)/180 ]
-            elif joint == "joint2" or joint == "joint3":
-                jointMatrix = [(ntz(jointMove.dfFlex)*math.pi)/180, (ntz(jointMove.dfAbd)*math.pi)/180 , (ntz(jointMove.dfRot)*math.pi)/180 ]
-            newJoints = [i - j for i, j in zip(baseHCpose['hand_joints'][fingerJoint], jointMatrix)]
-            newHCpose['hand_joints'][fingerJoint] = newJoints  
+        lineIndent = len(line) - len(content)
+        if lineIndent < indent:
+            break
+        if lineIndent > indent or ":" not in content:
+            raise poseFormatError("Line %s isn't part of a block mapping." % (i+1))
+        key, value = content.split(":", 1)
+        if not keyPattern.match(key):
+            raise poseFormatError("Line %s has a key that needs yaml." % (i+1))
+        value = value.strip()
+        i += 1
+        if value == "[]":
+            out[key] = []
+        elif value == "{}":
+            out[key] = {}
+        elif value != "":
+            out[key] = parseScalar(value)
+        elif i < len(lines) and lines[i][indent:indent+2] == "- " and lines[i][:indent].strip() == "":
+            # a sequence of scalars, at the same indentation as its key
+            items = []
+            while i < len(lines) and lines[i][indent:indent+2] == "- " and lines[i][:indent].strip() == "":
+                items.append(parseScalar(lines[i][indent+2:].strip()))
+                i += 1
+            out[key] = items
         else:
-            jointMove = getattr(getattr(diff.hand, fingMap[finger]), fingerJointMap[joint])
-            jointMatrix = [(ntz(jointMove.dfFlex)*math.pi)/180, (ntz(jointMove.dfAbd)*math.pi)/180 , (ntz(jointMove.dfRot)*math.pi)/180 ]
-            newJoints = [i - j for i, j in zip(baseHCpose['hand_joints'][fingerJoint], jointMatrix)]
-            newHCpose['hand_joints'][fingerJoint] = newJoints
-    
-    wristMatrix = [(ntz(diff.wrist.dfFlex)*math.pi)/180, (ntz(0)*math.pi)/180 , (ntz(diff.wrist.dfPro)*math.pi)/180 ]
-    newHCpose['hand_joints']['metacarpals'] = [i - j for i, j in zip(baseHCpose['hand_joints']['metacarpals'], wristMatrix)]
-    
-    
-    rootMatrix = [(ntz(0)*math.pi)/180, ((ntz(diff.wrist.dfPro)*math.pi)/180)*-(3/4), ((ntz(diff.wrist.dfPro)*math.pi)/180)*(5/4) ]
-    newHCpose['hand_joints']['carpals'] = [i - j for i, j in zip(baseHCpose['hand_joints']['carpals'], rootMatrix)]
-    
-        
+            out[key], i = parseBlock(lines, i, indent+2)
+    return out, i
+
+# the types that yaml writes without anchors and aliases, so the pose writer can write them directly
+scalarTypes = (float, bool, int, str, type(u""), type(None))
+
+def formatScalar(value):
+    """A scalar as yaml.dump writes it"""
+    if type(value) is float:
+        if value != value:
+            return ".nan"
+        if value in (float("inf"), -float("inf")):
+            return ".inf" if value > 0 else "-.inf"
+        text = repr(value).lower()
+        if "." not in text and "e" in text:
+            text = text.replace("e", ".0e", 1)
+        return text
+    if type(value) is int:
+        return str(value)
+    if type(value) not in scalarTypes:
+        raise poseFormatError("%r needs yaml." % (value,))
+    key = (type(value), value)
+    try:
+        return scalarsWritten[key]
+    except KeyError:
+        text = yaml.dump(value)
+        if text.endswith("\n...\n"):
+            text = text[:-len("\n...\n")]
+        text = text.rstrip("\n")
+        if "\n" in text:
+            raise poseFormatError("%r can't be written on one line." % (value,))
+        scalarsWritten[key] = text
+        return text
+
+def formatBlock(mapping, indent, lines, seen):
+    # yaml writes mappings and sequences that appear more than once as aliases
+    if id(mapping) in seen:
+        raise poseFormatError("Poses with aliases need yaml.")
+    seen.add(id(mapping))
+    for key in sorted(mapping):
+        value = mapping[key]
+        if type(key) is not str or not keyPattern.match(key):
+            raise poseFormatError("The key %r needs yaml." % (key,))
+        if type(value) is dict and value:
+            lines.append("%s%s:" % (" "*indent, key))
+            formatBlock(value, indent+2, lines, seen)
+        elif type(value) is list and value:
+            if id(value) in seen:
+                raise poseFormatError("Poses with aliases need yaml.")
+            seen.add(id(value))
+            lines.append("%s%s:" % (" "*indent, key))
+            prefix = " "*indent + "- "
+            for item in value:
+                lines.append(prefix + formatScalar(item))
+        elif type(value) is dict:
+            lines.append("%s%s: {}" % (" "*indent, key))
+        elif type(value) is list:
+            lines.append("%s%s: []" % (" "*indent, key))
+        else:
+            lines.append("%s%s: %s" % (" "*indent, key, formatScalar(value)))
+
+def formatPose(pose):
+    """The text that yaml.dump(pose) writes, formatted directly for poses of mappings, sequences and scalars"""
+    if type(pose) is not dict:
+        return yaml.dump(pose)
+    try:
+        lines = []
+        formatBlock(pose, 0, lines, set())
+    except poseFormatError:
+        return yaml.dump(pose)
+    if not lines:
+        return yaml.dump(pose)
+    lines.append("")
+    return "\n".join(lines)
+
+def writePose(pose, poseOutFilePath):
+    """Writes a pose file that imageGen can read"""
+    with open(poseOutFilePath, 'w') as poseOutFile:
+        poseOutFile.write(poseHeader + "\n" + formatPose(pose))
+
+def writePoses(poses, fileObj):
+    """Writes many poses to fileObj, an open file or stream, one after another, each as writePose would write it"""
+    for pose in poses:
+        fileObj.write(poseHeader + "\n" + formatPose(pose))
+
+##### building poses #####
+# The digits and joints of the fingerXjointY entries of a pose's hand_joints
+poseFingers = {"finger4": 'index',
+               "finger3": 'middle',
+               "finger2": 'ring',
+               "finger1": 'pinky',
+               "finger5": 'thumb'}
+poseFingerJoints = {"joint1": 'MCP',
+                    "joint2": 'PIP',
+                    "joint3": 'DIP'}
+poseThumbJoints = {"joint1": 'CM',
+                   "joint2": 'MCP',
+                   "joint3": 'IP'}
+
+def poseLayout(baseHCpose):
+    """Returns how each entry of a pose's hand_joints moves with an arm configuration
+
+    The entries are the names of the hand_joints that move, slots is a len(entries) x 3 array
+    of the hc.armLayout position that moves each of their values (hc.armSize for values that
+    don't move) and scales what each move is multiplied by."""
+    entries = []
+    slots = []
+    scales = []
+    for entry in sorted(baseHCpose['hand_joints']):
+        finger = entry[0:7]
+        joint = entry[7:13]
+        if finger[0:-1] == "finger" and joint[0:-1] == "joint":
+            digit = poseFingers[finger]
+            jnt = (poseThumbJoints if digit == "thumb" else poseFingerJoints)[joint]
+            # these joint mappings are wrong wrong wrong (for the thumb's CM).
+            dfs = [(digit, jnt, df) for df in ("dfFlex", "dfAbd", "dfRot")]
+            entryScales = [1, 1, 1]
+        elif entry == "metacarpals":
+            dfs = [("wrist", "wrist", "dfFlex"), None, ("wrist", "wrist", "dfPro")]
+            entryScales = [1, 1, 1]
+        elif entry == "carpals":
+            # the root follows pronation, with the integer division (3/4 == 0 and 5/4 == 1) of python 2
+            dfs = [None, ("wrist", "wrist", "dfPro"), ("wrist", "wrist", "dfPro")]
+            entryScales = [1, -(3//4), 5//4]
+        else:
+            continue
+        entries.append(entry)
+        slots.append([hc.armIndex.get(df, hc.armSize) for df in dfs])
+        scales.append(entryScales)
+    return entries, np.array(slots, dtype=np.intp).reshape(-1, 3), np.array(scales, dtype=float).reshape(-1, 3)
+
+def poseArrays(arms, baseHCpose, baseHC=baseHC):
+    """Returns the entries of baseHCpose's hand_joints that move, and an N x len(entries) x 3 array of their values for every arm configuration
+
+    arms is an N x hc.armSize array, or an iterable of arm configurations (see hc.armsToArray).
+    Every pose is baseHCpose moved by the difference between baseHC and an arm configuration,
+    with unspecified degrees of freedom not moving."""
+    entries, slots, scales = poseLayout(baseHCpose)
+    angles = hc.armsToArray(arms)
+    # the difference in radians, with a last column of zeros for the values that don't move
+    moves = np.zeros((len(angles), hc.armSize+1))
+    moves[:, :hc.armSize] = baseHC.angles - angles
+    moves[np.isnan(moves)] = 0
+    moves = (moves*math.pi)/180
+    base = np.array([baseHCpose['hand_joints'][entry] for entry in entries], dtype=float).reshape(-1, 3)
+    return entries, base - moves[:, slots]*scales
+
+def poseFromArray(values, entries, baseHCpose):
+    """Returns a copy of baseHCpose with the entries of its hand_joints set to the rows of values (see poseArrays)"""
+    pose = dict((key, copy.deepcopy(value)) for key, value in baseHCpose.items() if key != 'hand_joints')
+    pose['hand_joints'] = handJoints = dict(zip(entries, values.tolist()))
+    for key, value in baseHCpose['hand_joints'].items():
+        if key not in handJoints:
+            handJoints[key] = copy.deepcopy(value)
+    return pose
+
+def buildPoses(arms, baseHCpose, baseHC=baseHC):
+    """Yields the pose of every arm configuration in arms, see poseArrays"""
+    entries, values = poseArrays(arms, baseHCpose, baseHC)
+    for row in values:
+        yield poseFromArray(row, entries, baseHCpose)
+
+def buildPose(hc, baseHCpose, baseHC=baseHC):
+    """Returns a copy of the pose baseHCpose moved by the difference between baseHC and the arm configuration hc"""
+    entries, values = poseArrays([hc], baseHCpose, baseHC)
+    return poseFromArray(values[0], entries, baseHCpose)
+
+def runImageGen(poseOutFilePath, imageOutFile, devnull=None):
+    """Renders the pose in poseOutFilePath to imageOutFile, returns imageGen's return code"""
+    cmd = [imageGen, sceneSpecFile, poseOutFilePath, imageOutFile]
+    if devnull is None:
+        devnull = open(os.devnull, 'w')
+        try:
+            return subprocess.call(cmd, stdout=devnull, stderr=subprocess.STDOUT)
+        finally:
+            devnull.close()
+    return subprocess.call(cmd, stdout=devnull, stderr=subprocess.STDOUT)
+
+def tmpPoseFile(prefix=""):
+    """Creates a new, uniquely named, pose file in tmpDir and returns its path"""
     # make tmp directory if it doesn't exist
-    if not path.exists(path.join(funcs.resources_dir,"tmp")):
-        makedirs(path.join(funcs.resources_dir,"tmp"))
-    
-    poseOutFilePath = path.join(funcs.resources_dir,''.join(["tmp/",path.basename(imageOutFile),"poseOut.yml"]))
+    try:
+        makedirs(tmpDir)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    poseFd, poseOutFilePath = tempfile.mkstemp(prefix=prefix, suffix="poseOut.yml", dir=tmpDir)
+    os.close(poseFd)
+    return poseOutFilePath
+
+##### render cache #####
+class renderCache(object):
+    """A cache of rendered images, keyed by a hash of the pose, the base pose file and the scene spec
+
+    Images are kept in cacheDir. When the images take up more than maxBytes the least recently
+    used ones are removed. The size and last use of every image is kept in memory, read from the
+    directory when it is first needed, so storing an image doesn't list the whole cache. The
+    cache directory can be shared by many processes, but images the others add are only seen
+    (and counted against maxBytes) after rescan(); renderBatch and renderSequence use the cache
+    from the calling process alone."""
+    def __init__(self, cacheDir=cacheDir, maxBytes=512*1024*1024):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.fileDigests = {}
+        self.hits = 0
+        self.misses = 0
+        # name: (last used, size) of every image in the cache, None until the directory is read
+        self.images = None
+        self.totalBytes = 0
+        funcs.profiler.registerCache("render " + cacheDir, self)
+        try:
+            makedirs(cacheDir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def fileDigest(self, filePath):
+        """Returns the hash of a file's contents, rehashing only if the file has changed"""
+        stat = os.stat(filePath)
+        key = (filePath, stat.st_mtime, stat.st_size)
+        if key not in self.fileDigests:
+            fileObj = open(filePath, "rb")
+            self.fileDigests[key] = hashlib.sha1(fileObj.read()).hexdigest()
+            fileObj.close()
+        return self.fileDigests[key]
+
+    def key(self, pose, baseHCposeFile, imageOutFile):
+        """Returns the cache key (and file name) for rendering pose to imageOutFile"""
+        digest = hashlib.sha1()
+        digest.update(formatPose(pose).encode("utf-8"))
+        digest.update(self.fileDigest(baseHCposeFile).encode("utf-8"))
+        digest.update(self.fileDigest(sceneSpecFile).encode("utf-8"))
+        return digest.hexdigest() + path.splitext(imageOutFile)[1]
+
+    def fetch(self, key, imageOutFile):
+        """Copies the cached image for key to imageOutFile, returns False if there isn't one"""
+        cachedFile = path.join(self.cacheDir, key)
+        try:
+            shutil.copyfile(cachedFile, imageOutFile)
+            # the modification time records when the image was last used
+            os.utime(cachedFile, None)
+        except (IOError, OSError):
+            self.misses += 1
+            self.forget(key)
+            return False
+        self.hits += 1
+        if self.images is not None and key in self.images:
+            self.images[key] = (time.time(), self.images[key][1])
+        return True
+
+    def store(self, key, imageOutFile):
+        """Adds a rendered image to the cache, and evicts the least recently used images if it is too big"""
+        if not path.exists(imageOutFile):
+            return
+        tmpFd, tmpFile = tempfile.mkstemp(dir=self.cacheDir, suffix=".tmp")
+        os.close(tmpFd)
+        shutil.copyfile(imageOutFile, tmpFile)
+        size = path.getsize(tmpFile)
+        os.rename(tmpFile, path.join(self.cacheDir, key))
+        if self.images is None:
+            self.rescan()
+        else:
+            self.forget(key)
+            self.images[key] = (time.time(), size)
+            self.totalBytes += size
+        self.evict()
+
+    def rescan(self):
+        """Reads the size and last use of every image from the cache directory"""
+        self.images = {}
+        for name in os.listdir(self.cacheDir):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(path.join(self.cacheDir, name))
+            except OSError:
+                continue
+            self.images[name] = (stat.st_mtime, stat.st_size)
+        self.totalBytes = sum(size for used, size in self.images.values())
+
+    def forget(self, key):
+        if self.images is not None and key in self.images:
+            self.totalBytes -= self.images.pop(key)[1]
+
+    def evict(self):
+        """Removes the least recently used images until the cache is no bigger than maxBytes"""
+        if self.images is None:
+            self.rescan()
+        if self.totalBytes <= self.maxBytes:
+            return
+        for used, name in sorted((used, name) for name, (used, size) in self.images.items()):
+            if self.totalBytes <= self.maxBytes:
+                break
+            try:
+                os.remove(path.join(self.cacheDir, name))
+            except OSError:
+                pass
+            self.forget(name)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+def renderImage(hc, imageOutFile, baseHCposeFile=baseHCposeFile, baseHC=baseHC, cache=None):
+    ##### Read in the base pose to alter #####
+    newHCpose = buildPose(hc, loadPose(baseHCposeFile), baseHC)
+
+    if cache is not None:
+        key = cache.key(newHCpose, baseHCposeFile, imageOutFile)
+        if cache.fetch(key, imageOutFile):
+            return
+
+    # the pose file name is unique, so renders of images with the same name don't collide
+    poseOutFilePath = tmpPoseFile(path.basename(imageOutFile))
     print(poseOutFilePath)
-    poseOutFile = open(poseOutFilePath, 'w') 
-    poseOutFile.write("%YAML:1.0\n")
-    yaml.dump(newHCpose, poseOutFile)
-    poseOutFile.close()
-    
-    
-    cmd = [path.join(funcs.resources_dir,"imageGen"), path.join(funcs.resources_dir,"hand_model/scene_spec.yml"), poseOutFilePath, imageOutFile]
-    devnull = open('/dev/null', 'w')
-    subprocess.call(cmd, stdout=devnull, stderr=subprocess.STDOUT)
-    
-##### Tests ######
-#ensure that all articulatory model specifications are readable
-if not path.exists("./let"):
-   makedirs("./let")
-for ltr in letters.lettersCols['letter']:
     try:
-        AMarm = letters.letterToArm(ltr)
+        writePose(newHCpose, poseOutFilePath)
+        returnCode = runImageGen(poseOutFilePath, imageOutFile)
+    finally:
+        os.remove(poseOutFilePath)
+    if cache is not None and returnCode == 0:
+        cache.store(key, imageOutFile)
+
+##### rendering sessions #####
+class renderer(object):
+    """A rendering session that renders many arm configurations with the same base pose
+
+    The base pose is read once, poses are built in memory, and every image reuses the same
+    temporary pose file and output handles. imageGen renders a single pose file per run, so it is
+    still started once per image. With a renderCache, images that have been rendered before are
+    copied from the cache instead. Use as a context manager, or call close() when done."""
+    def __init__(self, baseHCposeFile=baseHCposeFile, baseHC=baseHC, cache=None):
+        self.baseHCposeFile = baseHCposeFile
+        self.baseHCpose = loadPose(baseHCposeFile)
+        self.baseHC = baseHC
+        self.cache = cache
+        self.poseOutFilePath = tmpPoseFile()
+        self.devnull = open(os.devnull, 'w')
+
+    def render(self, hc, imageOutFile):
+        """Renders the arm configuration hc to imageOutFile, returns imageGen's return code (0 for cached images)"""
+        pose = buildPose(hc, self.baseHCpose, self.baseHC)
+        if self.cache is not None:
+            key = self.cache.key(pose, self.baseHCposeFile, imageOutFile)
+            if self.cache.fetch(key, imageOutFile):
+                return 0
+        writePose(pose, self.poseOutFilePath)
+        returnCode = runImageGen(self.poseOutFilePath, imageOutFile, self.devnull)
+        if self.cache is not None and returnCode == 0:
+            self.cache.store(key, imageOutFile)
+        return returnCode
+
+    def renderFrames(self, arms, imageOutFiles):
+        """Renders many arm configurations (an N x hc.armSize array, or an iterable) to imageOutFiles, yielding (image file, return code) for each
+
+        The poses of all of the frames are built at once (see poseArrays)."""
+        entries, values = poseArrays(arms, self.baseHCpose, self.baseHC)
+        if len(values) != len(imageOutFiles):
+            raise specificationError("There are %s image files for %s frames." % (len(imageOutFiles), len(values)))
+        for row, imageOutFile in zip(values, imageOutFiles):
+            pose = poseFromArray(row, entries, self.baseHCpose)
+            if self.cache is not None:
+                key = self.cache.key(pose, self.baseHCposeFile, imageOutFile)
+                if self.cache.fetch(key, imageOutFile):
+                    yield imageOutFile, 0
+                    continue
+            writePose(pose, self.poseOutFilePath)
+            returnCode = runImageGen(self.poseOutFilePath, imageOutFile, self.devnull)
+            if self.cache is not None and returnCode == 0:
+                self.cache.store(key, imageOutFile)
+            yield imageOutFile, returnCode
+
+    def renderStream(self, jobs):
+        """Renders (arm configuration, image file) pairs as they arrive, yielding (image file, return code) for each"""
+        for hc, imageOutFile in jobs:
+            yield imageOutFile, self.render(hc, imageOutFile)
+
+    def close(self):
+        if path.exists(self.poseOutFilePath):
+            os.remove(self.poseOutFilePath)
+        self.devnull.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+##### batch rendering #####
+# The rendering session of a worker process in renderBatch
+workerSession = None
+
+def startWorker(baseHCposeFile):
+    global workerSession
+    workerSession = renderer(baseHCposeFile)
+    # remove the worker's pose file when the pool shuts it down
+    util.Finalize(workerSession, workerSession.close, exitpriority=10)
+
+def fetchCached(cache, poses, baseHCposeFile, imageOutFiles):
+    """Copies the images of poses that are in cache to their image files, returns the cache key of every pose and the indices of those that weren't cached
+
+    The batch and sequence renderers use their cache only in the calling process, so that its
+    index, its size limit and its hits and misses cover every job; the workers only render the
+    images that weren't cached, and the caller stores them."""
+    keys = []
+    misses = []
+    for index, (pose, imageOutFile) in enumerate(zip(poses, imageOutFiles)):
+        key = cache.key(pose, baseHCposeFile, imageOutFile)
+        keys.append(key)
+        if not cache.fetch(key, imageOutFile):
+            misses.append(index)
+    return keys, misses
+
+def renderJob(job):
+    """Renders one (index, arm configuration angles, image file) job in a worker, returns (index, image file, error)"""
+    index, angles, imageOutFile = job
+    try:
+        returnCode = workerSession.render(hc.armconfiguration.fromArray(angles), imageOutFile)
+    except Exception as e:
+        return index, imageOutFile, "%s: %s" % (e.__class__.__name__, e)
+    if returnCode != 0:
+        return index, imageOutFile, "imageGen exited with %s" % (returnCode)
+    return index, imageOutFile, None
+
+def renderBatch(jobs, processes=None, baseHCposeFile=baseHCposeFile, progress=None, cache=None):
+    """Renders many (arm configuration, image file) jobs with a pool of worker processes
+
+    Each worker keeps a rendering session (see renderer) with its own pose file, so jobs never
+    share temporary files. processes defaults to the number of cpus. progress, if given, is
+    called as progress(done, total, imageOutFile, error) after every job; error is None for jobs
+    that rendered. With a renderCache the cached images are copied before the pool starts, and
+    only the others are rendered (see fetchCached). Returns a list with the error (or None) for
+    each job, in the order of jobs."""
+    jobs = list(jobs)
+    errors = [None]*len(jobs)
+    done = 0
+    keys = None
+    misses = range(len(jobs))
+    if cache is not None:
+        baseHCpose = loadPose(baseHCposeFile)
+        poses = (buildPose(arm, baseHCpose) for arm, imageOutFile in jobs)
+        keys, misses = fetchCached(cache, poses, baseHCposeFile, [imageOutFile for arm, imageOutFile in jobs])
+        for index in sorted(set(range(len(jobs))) - set(misses)):
+            done += 1
+            if progress is not None:
+                progress(done, len(jobs), jobs[index][1], None)
+    jobs = [(index, jobs[index][0].angles, jobs[index][1]) for index in misses]
+    if not jobs:
+        return errors
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(jobs)))
+    pool = multiprocessing.Pool(processes, initializer=startWorker, initargs=(baseHCposeFile,))
+    try:
+        for index, imageOutFile, error in pool.imap_unordered(renderJob, jobs):
+            errors[index] = error
+            if keys is not None and error is None:
+                cache.store(keys[index], imageOutFile)
+            done += 1
+            if progress is not None:
+                progress(done, len(errors), imageOutFile, error)
+        pool.close()
     except:
-        print("error with "+ltr+". can't convert from articulatory specifications to AM handshape")   
-        break
-    pth = path.join("./let/",''.join(["am-",ltr,".png"]))
-    print(pth)
-    renderImage(AMarm.toArmTarget(), pth)    
-    
-    # try:
-    #     PMarm = hs.arm(handshape=letters.letterToPM(ltr).toAMhandshape(), orientation=letters.letterCodingCols[ltr]["orientation"])
-    # except:
-    #     print("Error with "+ltr+". can't convert from PM notation to AM handshape")
-    #     break
-    # renderImage(PMarm.toArmTarget(), path.join("./let/",''.join(["pm-",ltr,".png"])))   
\ No newline at end of file
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return errors
+
+##### rendering sequences #####
+def renderChunk(job, session=None):
+    """Renders one (frame indices, angles, image files) chunk of frames with session (the worker's by default), returns a list of (index, image file, error)"""
+    indices, angles, imageOutFiles = job
+    if session is None:
+        session = workerSession
+    out = []
+    try:
+        for i, (imageOutFile, returnCode) in enumerate(session.renderFrames(angles, imageOutFiles)):
+            out.append((indices[i], imageOutFile, None if returnCode == 0 else "imageGen exited with %s" % (returnCode)))
+    except Exception as e:
+        error = "%s: %s" % (e.__class__.__name__, e)
+        out.extend((indices[i], imageOutFiles[i], error) for i in range(len(out), len(imageOutFiles)))
+    return out
+
+def sequenceFiles(imageOutPattern, frames):
+    """The image file of every frame, imageOutPattern with the number of the frame (e.g. frames/%05d.png)"""
+    try:
+        return [imageOutPattern % (frame) for frame in range(frames)]
+    except TypeError:
+        raise specificationError("The image files need a pattern with a place for the frame number, like frames/%%05d.png, got %s instead." % (imageOutPattern))
+
+def renderSequence(arms, imageOutPattern, processes=1, baseHCposeFile=baseHCposeFile, progress=None, cache=None, chunkSize=64):
+    """Renders a sequence of frames (an N x hc.armSize array, or an iterable of arm configurations) to numbered images
+
+    The image of frame i is imageOutPattern % i (see sequenceFiles). The poses are built a
+    chunk of chunkSize frames at a time; with more than one process the chunks are rendered by a
+    pool of worker processes, each with its own rendering session. progress and cache are as
+    for renderBatch. Returns a list with the error (or None) for each frame."""
+    angles = hc.armsToArray(arms)
+    imageOutFiles = sequenceFiles(imageOutPattern, len(angles))
+    for directory in set(path.dirname(imageOutFile) for imageOutFile in imageOutFiles):
+        if directory and not path.isdir(directory):
+            makedirs(directory)
+    errors = [None]*len(angles)
+    done = [0]
+    keys = None
+    misses = list(range(len(angles)))
+    if cache is not None:
+        baseHCpose = loadPose(baseHCposeFile)
+        entries, values = poseArrays(angles, baseHCpose)
+        poses = (poseFromArray(row, entries, baseHCpose) for row in values)
+        keys, misses = fetchCached(cache, poses, baseHCposeFile, imageOutFiles)
+        for index in sorted(set(range(len(angles))) - set(misses)):
+            done[0] += 1
+            if progress is not None:
+                progress(done[0], len(angles), imageOutFiles[index], None)
+    chunks = []
+    for start in range(0, len(misses), chunkSize):
+        indices = misses[start:start+chunkSize]
+        chunks.append((indices, angles[indices], [imageOutFiles[index] for index in indices]))
+    def collect(results):
+        for result in results:
+            for index, imageOutFile, error in result:
+                errors[index] = error
+                if keys is not None and error is None:
+                    cache.store(keys[index], imageOutFile)
+                done[0] += 1
+                if progress is not None:
+                    progress(done[0], len(angles), imageOutFile, error)
+    if not chunks:
+        return errors
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(chunks)))
+    if processes == 1:
+        with renderer(baseHCposeFile) as session:
+            collect(renderChunk(chunk, session) for chunk in chunks)
+        return errors
+    pool = multiprocessing.Pool(processes, initializer=startWorker, initargs=(baseHCposeFile,))
+    try:
+        collect(pool.imap_unordered(renderChunk, chunks))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return errors
+
+def printProgress(done, total, imageOutFile, error):
+    """A progress function for renderBatch that prints every job"""
+    if error is None:
+        print("[%s/%s] %s" % (done, total, imageOutFile))
+    else:
+        print("[%s/%s] %s failed: %s" % (done, total, imageOutFile, error))
+
+##### instrumentation, see funcs.profiler #####
+funcs.profiler.hook("pose load", sys.modules[__name__], "loadPose")
+funcs.profiler.hook("pose build", sys.modules[__name__], "buildPose", "buildPoses", "poseArrays", "poseFromArray")
+funcs.profiler.hook("yaml write", sys.modules[__name__], "writePose")
+funcs.profiler.hook("imageGen", sys.modules[__name__], "runImageGen")
+
+##### Tests ######
+def renderAllLetters(outDir="./let"):
+    """Renders every letter from its articulatory specification into outDir"""
+    letters.ensureLetters()
+    #ensure that all articulatory model specifications are readable
+    if not path.exists(outDir):
+        makedirs(outDir)
+    for ltr in letters.lettersCols['letter']:
+        try:
+            AMarm = letters.letterToArm(ltr)
+        except:
+            print("error with "+ltr+". can't convert from articulatory specifications to AM handshape")   
+            break
+        pth = path.join(outDir,''.join(["am-",ltr,".png"]))
+        print(pth)
+        renderImage(AMarm.toArmTarget(), pth)    
+
+        # try:
+        #     PMarm = hs.arm(handshape=letters.letterToPM(ltr).toAMhandshape(), orientation=letters.letterCodingCols[ltr]["orientation"])
+        # except:
+        #     print("Error with "+ltr+". can't convert from PM notation to AM handshape")
+        #     break
+        # renderImage(PMarm.toArmTarget(), path.join(outDir,''.join(["pm-",ltr,".png"])))
+
+if __name__ == "__main__":
+    renderAllLetters()
@@ -0,0 +1,166 @@
+"""Finding the phonologically specified handshapes nearest to measured hand configurations
+
+The candidate configurations are packed into one array when the index is built, so a search is a
+few vectorized operations over that array rather than a subtraction of configuration objects
+for every candidate. Distances are the same as totalDegreesDifferent() (method="unweighted")
+or weightedDegreesDifferent() (method="weighted") of the difference between the two.
+"""
+import hc
+import letters
+
+import numpy as np
+
+##### Error classes #####
+class searchError(Exception):
+    pass
+
+##### packing configurations #####
+def configurationsToArray(configurations, size):
+    """Stacks hand (size=hc.handSize) or arm (size=hc.armSize) configurations into an N x size array, the hands of arms if size is hc.handSize
+
+    configurations can be an array already, or any iterable of configuration objects (or
+    objects with toHandconfigTarget/toArmTarget methods, like hs.handshape and hs.arm)."""
+    if isinstance(configurations, np.ndarray):
+        angles = np.asarray(configurations, dtype=float)
+        if angles.ndim == 1:
+            angles = angles.reshape(1, -1)
+        if size == hc.handSize and angles.ndim == 2 and angles.shape[1] == hc.armSize:
+            angles = angles[:, hc.wristSize:]
+        if angles.ndim != 2 or angles.shape[1] != size:
+            raise searchError("Configurations need an N x %s array, got shape %s instead." % (size, str(angles.shape)))
+        return angles
+    angles = []
+    for configuration in configurations:
+        angles.append(configurationToArray(configuration, size))
+    return np.array(angles, dtype=float).reshape(len(angles), size)
+
+def configurationToArray(configuration, size):
+    """Returns the angles of one hand or arm configuration, the hand of an arm if size is hc.handSize"""
+    if isinstance(configuration, np.ndarray):
+        angles = configuration
+    else:
+        if size == hc.handSize and hasattr(configuration, "toHandconfigTarget"):
+            configuration = configuration.toHandconfigTarget()
+        elif hasattr(configuration, "toArmTarget"):
+            configuration = configuration.toArmTarget()
+        angles = configuration.angles
+    angles = np.asarray(angles, dtype=float)
+    if size == hc.handSize and angles.shape == (hc.armSize,):
+        angles = angles[hc.wristSize:]
+    if angles.shape != (size,):
+        raise searchError("A configuration needs %s values, got shape %s instead." % (size, str(angles.shape)))
+    return angles
+
+##### the index #####
+class handshapeIndex(object):
+    """An index of phonologically specified hand (or arm) configurations
+
+    configurations are the candidates (see configurationsToArray) and labels names them (the
+    position of each configuration by default). Candidates with identical angles are only
+    stored, and compared, once."""
+    def __init__(self, configurations, labels=None, method="unweighted", size=hc.handSize):
+        if size == hc.handSize:
+            weights = hc.methodWeights(method, hc.handWeights)
+        elif size == hc.armSize:
+            weights = hc.methodWeights(method, hc.armWeights)
+        else:
+            raise searchError("The index can only be of hand (%s) or arm (%s) configurations." % (hc.handSize, hc.armSize))
+        angles = configurationsToArray(configurations, size)
+        if labels is None:
+            labels = range(len(angles))
+        labels = list(labels)
+        if len(labels) != len(angles):
+            raise searchError("There are %s labels for %s configurations." % (len(labels), len(angles)))
+        # merge configurations with identical angles (unspecified degrees of freedom included)
+        rows = {}
+        self.labels = []
+        self.positions = []
+        unique = []
+        for position, (row, label) in enumerate(zip(angles, labels)):
+            key = row.tobytes()
+            try:
+                self.labels[rows[key]].append(label)
+                self.positions[rows[key]].append(position)
+            except KeyError:
+                rows[key] = len(unique)
+                unique.append(row)
+                self.labels.append([label])
+                self.positions.append([position])
+        self.method = method
+        self.size = size
+        self.angles = np.array(unique, dtype=float).reshape(len(unique), size)
+        specified = ~np.isnan(self.angles)
+        # unspecified degrees of freedom are zeroed, and weighted by zero, so that they contribute nothing
+        self.filled = np.where(specified, self.angles, 0)
+        self.weights = specified * weights
+
+    @classmethod
+    def fromLetters(cls, method="unweighted", size=hc.handSize):
+        """An index of the configurations of the letters, labeled by letter"""
+        letters.ensureLetters()
+        names = letters.lettersCols["letter"]
+        targets = np.array([letters.cachedLetterToArmTarget(ltr).angles for ltr in names])
+        # the hand is the last handSize angles of an arm
+        return cls(targets[:, hc.armSize-size:], names, method, size)
+
+    def __len__(self):
+        return sum(len(labels) for labels in self.labels)
+
+    def distances(self, configuration):
+        """The degrees different between configuration and every (distinct) candidate, in the order of self.angles"""
+        return self.blockDistances(configurationToArray(configuration, self.size)[np.newaxis])[0]
+
+    def blockDistances(self, angles):
+        """The degrees different between every row of angles and every (distinct) candidate"""
+        specified = ~np.isnan(angles)
+        diff = np.abs(self.filled[np.newaxis] - np.where(specified, angles, 0)[:, np.newaxis])
+        diff *= self.weights
+        diff *= specified[:, np.newaxis]
+        return diff.sum(axis=2)
+
+    def nearestLabels(self, distances, k):
+        """The k candidates with the smallest distances, as a list of (distance, label) tuples
+
+        Candidates that are equally close are in the order they were given in."""
+        if k < len(distances):
+            # everything tied with the kth smallest distance could be among the k
+            kth = distances[np.argpartition(distances, k-1)[k-1]]
+            rows = np.flatnonzero(distances <= kth)
+        else:
+            rows = np.arange(len(distances))
+        nearest = sorted((distances[row], position, label) for row in rows for position, label in zip(self.positions[row], self.labels[row]))
+        return [(hc.number(distance), label) for distance, position, label in nearest[:k]]
+
+    def nearest(self, configuration, k=1):
+        """The k candidates closest to configuration, as a list of (distance, label) tuples, closest first"""
+        if k < 1:
+            raise searchError("k needs to be at least 1, got %s instead." % (str(k)))
+        return self.nearestLabels(self.distances(configuration), k)
+
+    def nearestMany(self, configurations, k=1, blockSize=None):
+        """nearest for many configurations (e.g. every frame of a recording), returns a list of lists of (distance, label) tuples
+
+        The distances are computed for blockSize configurations at a time (by default as many
+        as keep the block to about a million degrees of freedom)."""
+        if k < 1:
+            raise searchError("k needs to be at least 1, got %s instead." % (str(k)))
+        angles = configurationsToArray(configurations, self.size)
+        if len(self.angles) == 0:
+            # there is nothing to be near to
+            return [[] for row in angles]
+        if blockSize is None:
+            blockSize = max(1, 2**20 // (len(self.angles)*self.size))
+        out = []
+        for start in range(0, len(angles), blockSize):
+            block = self.blockDistances(angles[start:start+blockSize])
+            for distances in block:
+                out.append(self.nearestLabels(distances, k))
+        return out
+
+def letterSearchIndex(method="unweighted"):
+    """The (cached) index of the hand configurations of the letters, see handshapeIndex.fromLetters"""
+    return letters.letterCache.get(("searchIndex", method), lambda: handshapeIndex.fromLetters(method))
+
+def nearestLetters(configuration, k=1, method="unweighted"):
+    """The k letters with hand configurations closest to configuration, as a list of (distance, letter) tuples"""
+    return letterSearchIndex(method).nearest(configuration, k)
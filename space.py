@@ -0,0 +1,431 @@
+"""The space of phonologically specified handshapes, enumerated and materialized as a table
+
+A handshapeSpace enumerates every combination of the phonological features in hs: the selected
+fingers (members, MCP, PIP and abduction), the secondary selected fingers (none, or members
+disjoint from the selected fingers with their own MCP, PIP and abduction), the opposition of the
+thumb (or none) and the joints of the nonselected fingers (none, or one of the joint levels).
+Every combination has a code, its position in the enumeration, and the hand configuration
+targets of the whole space can be computed block by block with array math.
+
+The full space is large (about 32.5 million codes, and 1.4GB as a table), so the feature
+levels that are enumerated can be restricted. materialize() writes the angles (as int16, the
+targets are whole degrees) and a validity mask to .npy files, and handshapeTable memory maps
+them, so that every process reading a table shares one copy:
+
+    space.handshapeSpace(secondary=False).materialize()
+    table = space.handshapeTable()
+"""
+import hs
+import hc
+import funcs
+
+import numpy as np
+import itertools
+from os import path, makedirs
+
+##### Error classes #####
+class spaceError(Exception):
+    pass
+
+##### the feature levels #####
+# Every subset of the digits, numbered by the bits of the digits in hc.handDigits order
+memberSets = [frozenset(digit for bit, digit in enumerate(hc.handDigits) if subset & (1 << bit)) for subset in range(2**len(hc.handDigits))]
+memberSetIndex = dict((members, subset) for subset, members in enumerate(memberSets))
+
+handIndex = dict((slot, i) for i, slot in enumerate(hc.handLayout))
+
+# missing (unspecified) degrees of freedom in the int16 tables
+missing = np.iinfo(np.int16).min
+
+# where tables are materialized by default
+spaceDir = path.join(funcs.resources_dir, "space")
+
+def nsfAbduction(joint):
+    """The abduction of the nonselected fingers, which follows from their joints (see hs.handshape.toHandconfigTarget)"""
+    if joint == "ext":
+        return "abducted"
+    return "adducted"
+
+##### the space #####
+class handshapeSpace(object):
+    """The handshapes with the given feature levels (all of the levels in hs by default)
+
+    If secondary is False there are no secondary selected fingers, and if nonSelected is False
+    there are no nonselected fingers."""
+    def __init__(self, joints=None, abductions=None, oppositions=None, secondary=True, nonSelected=True):
+        if joints is None:
+            joints = sorted(hs.phonoJoints)
+        if abductions is None:
+            abductions = sorted(hs.phonoAbduction["index"])
+        if oppositions is None:
+            oppositions = sorted(hs.phonoOpposition)
+        self.joints = [hs.jointCheck(joint) for joint in joints]
+        self.abductions = [hs.abdCheck(abd, hs.phonoAbduction["index"]) for abd in abductions]
+        self.oppositions = [hs.oppositionCheck(oppos) for oppos in oppositions]
+        self.secondary = bool(secondary)
+        self.nonSelected = bool(nonSelected)
+        # the levels of each feature, as numbers
+        jointAngles = np.array([hs.phonoJoints[joint] for joint in self.joints], dtype=float)
+        self.fingerAbduction = dict((digit, np.array([hs.phonoAbduction[digit][abd] for abd in self.abductions], dtype=float)) for digit in hc.handDigits if digit != "thumb")
+        self.jointAngles = jointAngles
+        # the CM targets of the thumb for every abduction and opposition, nan where there is none
+        self.thumbCM = np.empty((len(self.abductions), len(self.oppositions), 3))
+        for (a, abd), (o, oppos) in itertools.product(enumerate(self.abductions), enumerate(self.oppositions)):
+            cm = hs.phonoAbduction["thumb"][abd][oppos]
+            # hs.phonoAbduction has (flexion, rotation, abduction), the table stores (flexion, abduction, rotation) like hc.thumbDfs
+            self.thumbCM[a, o] = (np.nan, np.nan, np.nan) if cm is None else (cm[0], cm[2], cm[1])
+        self.nsfThumbCM = np.array([hs.phonoAbduction["thumb"][nsfAbduction(joint)]["unopposed"] for joint in self.joints], dtype=float)[:, [0, 2, 1]]
+        # every block has the same selected and secondary selected members
+        self.blocks = []
+        for sf in range(1, len(memberSets)):
+            self.blocks.append((sf, None))
+            if self.secondary:
+                for ssf in range(1, len(memberSets)):
+                    if memberSets[sf].isdisjoint(memberSets[ssf]):
+                        self.blocks.append((sf, ssf))
+        self.blockShapes = [self.blockShape(ssf) for sf, ssf in self.blocks]
+        self.offsets = np.concatenate(([0], np.cumsum([np.prod(shape) for shape in self.blockShapes]))).astype(np.int64)
+
+    def spec(self):
+        """The arguments that rebuild this space"""
+        return {"joints": list(self.joints), "abductions": list(self.abductions), "oppositions": list(self.oppositions),
+                "secondary": self.secondary, "nonSelected": self.nonSelected}
+
+    def blockShape(self, ssf):
+        """The number of levels of each feature that varies within a block, slowest first
+
+        The features are the selected fingers' MCP, PIP and abduction, (the secondary selected
+        fingers' MCP, PIP and abduction,) the opposition (0 for no thumb) and the nonselected
+        fingers' joints (0 for no nonselected fingers)."""
+        fingers = (len(self.joints), len(self.joints), len(self.abductions))
+        nsf = 1 + len(self.joints) if self.nonSelected else 1
+        if ssf is None:
+            return fingers + (1 + len(self.oppositions), nsf)
+        return fingers + fingers + (1 + len(self.oppositions), nsf)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    ##### codes and handshapes #####
+    def blockOf(self, code):
+        if code < 0 or code >= len(self):
+            raise spaceError("There is no handshape with code %s, the codes run from 0 to %s." % (str(code), len(self)-1))
+        return int(np.searchsorted(self.offsets, code, side="right")) - 1
+
+    def features(self, code):
+        """The selected members, secondary selected members (or None) and the levels of the other features of a code"""
+        block = self.blockOf(code)
+        sf, ssf = self.blocks[block]
+        levels = np.unravel_index(int(code - self.offsets[block]), self.blockShapes[block])
+        return sf, ssf, [int(level) for level in levels]
+
+    def handshape(self, code):
+        """The hs.handshape with a code"""
+        sf, ssf, levels = self.features(code)
+        selected = hs.selectedFingers(members=memberSets[sf], MCP=self.joints[levels[0]], PIP=self.joints[levels[1]], abd=self.abductions[levels[2]])
+        if ssf is None:
+            secondary = None
+            oppos, nsf = levels[3:]
+        else:
+            secondary = hs.secondarySelectedFingers(members=memberSets[ssf], MCP=self.joints[levels[3]], PIP=self.joints[levels[4]], abd=self.abductions[levels[5]])
+            oppos, nsf = levels[6:]
+        if oppos == 0:
+            thumb = None
+        else:
+            thumb = hs.thumb(oppos=self.oppositions[oppos-1])
+        if nsf == 0:
+            nonSelected = None
+        else:
+            nonSelected = hs.nonSelectedFingers(joints=self.joints[nsf-1])
+        return hs.handshape(selectedFingers=selected, secondarySelectedFingers=secondary, thumb=thumb, nonSelectedFingers=nonSelected)
+
+    def code(self, handshape):
+        """The code of an hs.handshape"""
+        try:
+            sf = memberSetIndex[handshape.SF.members]
+            levels = [self.joints.index(handshape.SF.MCP.value), self.joints.index(handshape.SF.PIP.value), self.abductions.index(handshape.SF.abd.value)]
+            if handshape.SSF is None or len(handshape.SSF.members) == 0:
+                ssf = None
+            else:
+                ssf = memberSetIndex[handshape.SSF.members]
+                levels += [self.joints.index(handshape.SSF.MCP.value), self.joints.index(handshape.SSF.PIP.value), self.abductions.index(handshape.SSF.abd.value)]
+            if handshape.thumb is None:
+                levels.append(0)
+            else:
+                levels.append(1 + self.oppositions.index(handshape.thumb.oppos.value))
+            if handshape.NSF is None:
+                levels.append(0)
+            elif self.nonSelected:
+                levels.append(1 + self.joints.index(handshape.NSF.joints.value))
+            else:
+                raise ValueError
+            block = self.blocks.index((sf, ssf))
+        except ValueError:
+            raise spaceError("The handshape is not in this space.")
+        return int(self.offsets[block] + np.ravel_multi_index(levels, self.blockShapes[block]))
+
+    def handshapes(self):
+        """Yields (code, hs.handshape) for every valid handshape in the space, in code order
+
+        This builds every handshape object, see blockAngles() for the targets of many handshapes at once."""
+        for block in range(len(self.blocks)):
+            size = int(self.offsets[block+1] - self.offsets[block])
+            for start in range(0, size, 2**16):
+                valid = self.blockAngles(block, start, min(start+2**16, size))[1]
+                for code in np.flatnonzero(valid) + self.offsets[block] + start:
+                    yield int(code), self.handshape(code)
+
+    ##### targets #####
+    def blockAngles(self, block, start=0, stop=None):
+        """The hand configuration targets of codes start to stop (counted from the start of a block)
+
+        Returns an N x hc.handSize array of angles (nan for unspecified degrees of freedom) and
+        whether each code is valid. Codes with a selected thumb that has no opposition, or an
+        abduction and opposition that have no target, are invalid, and their angles are all nan."""
+        sf, ssf = self.blocks[block]
+        shape = self.blockShapes[block]
+        if stop is None:
+            stop = int(np.prod(shape))
+        levels = np.unravel_index(np.arange(start, stop), shape)
+        out = np.empty((stop-start, hc.handSize))
+        out.fill(np.nan)
+        valid = np.ones(stop-start, dtype=bool)
+        groups = [(memberSets[sf], levels[0], levels[1], levels[2])]
+        if ssf is None:
+            oppos, nsf = levels[3:]
+        else:
+            groups.append((memberSets[ssf], levels[3], levels[4], levels[5]))
+            oppos, nsf = levels[6:]
+        # the (secondary) selected fingers
+        for members, mcp, pip, abd in groups:
+            for digit in members:
+                if digit == "thumb":
+                    cm = np.where((oppos > 0)[:, np.newaxis], self.thumbCM[abd, np.maximum(oppos-1, 0)], np.nan)
+                    valid &= ~np.isnan(cm[:, 0])
+                    out[:, handIndex[("thumb", "CM", "dfFlex")]] = cm[:, 0]
+                    out[:, handIndex[("thumb", "CM", "dfAbd")]] = cm[:, 1]
+                    out[:, handIndex[("thumb", "CM", "dfRot")]] = cm[:, 2]
+                    out[:, handIndex[("thumb", "MCP", "dfFlex")]] = self.jointAngles[mcp]
+                    out[:, handIndex[("thumb", "IP", "dfFlex")]] = self.jointAngles[pip]
+                else:
+                    out[:, handIndex[(digit, "MCP", "dfFlex")]] = self.jointAngles[mcp]
+                    out[:, handIndex[(digit, "MCP", "dfAbd")]] = self.fingerAbduction[digit][abd]
+                    out[:, handIndex[(digit, "PIP", "dfFlex")]] = self.jointAngles[pip]
+                    out[:, handIndex[(digit, "DIP", "dfFlex")]] = self.jointAngles[pip]
+        # the nonselected fingers, the rest of the digits when there are any
+        nonSelected = nsf > 0
+        joint = np.maximum(nsf-1, 0)
+        angle = np.where(nonSelected, self.jointAngles[joint], np.nan)
+        rest = set(hc.handDigits) - memberSets[sf] - (memberSets[ssf] if ssf is not None else frozenset())
+        for digit in rest:
+            if digit == "thumb":
+                cm = np.where(nonSelected[:, np.newaxis], self.nsfThumbCM[joint], np.nan)
+                out[:, handIndex[("thumb", "CM", "dfFlex")]] = cm[:, 0]
+                out[:, handIndex[("thumb", "CM", "dfAbd")]] = cm[:, 1]
+                out[:, handIndex[("thumb", "CM", "dfRot")]] = cm[:, 2]
+                out[:, handIndex[("thumb", "MCP", "dfFlex")]] = angle
+                out[:, handIndex[("thumb", "IP", "dfFlex")]] = angle
+            else:
+                abduction = np.array([hs.phonoAbduction[digit][nsfAbduction(jnt)] for jnt in self.joints], dtype=float)
+                out[:, handIndex[(digit, "MCP", "dfFlex")]] = angle
+                out[:, handIndex[(digit, "MCP", "dfAbd")]] = np.where(nonSelected, abduction[joint], np.nan)
+                out[:, handIndex[(digit, "PIP", "dfFlex")]] = angle
+                out[:, handIndex[(digit, "DIP", "dfFlex")]] = angle
+        out[~valid] = np.nan
+        return out, valid
+
+    def angles(self, codes):
+        """The hand configuration targets (and validity) of an array of codes"""
+        codes = np.asarray(codes, dtype=np.int64)
+        out = np.empty((len(codes), hc.handSize))
+        valid = np.empty(len(codes), dtype=bool)
+        if len(codes) and (codes.min() < 0 or codes.max() >= len(self)):
+            raise spaceError("The codes run from 0 to %s." % (len(self)-1))
+        blocks = np.searchsorted(self.offsets, codes, side="right") - 1
+        for block in np.unique(blocks):
+            rows = np.flatnonzero(blocks == block)
+            within = codes[rows] - self.offsets[block]
+            start = int(within.min())
+            blockOut, blockValid = self.blockAngles(block, start, int(within.max())+1)
+            out[rows] = blockOut[within-start]
+            valid[rows] = blockValid[within-start]
+        return out, valid
+
+    ##### from angles back to handshapes #####
+    def digitCosts(self, angles, weights):
+        """The degrees different between every frame of angles and every level of every digit
+
+        Returns two dictionaries by digit: the costs of the digit being (secondary) selected, an
+        N x joints x joints x abductions array over the MCP, PIP (and DIP or IP) and abduction
+        levels (with a last axis for the opposition, 0 for none, for the thumb), and the costs of
+        the digit being nonselected, an N x joints array. Degrees of freedom that are nan in
+        angles cost nothing, and thumb targets that don't exist cost inf."""
+        def levelCost(slot, levels):
+            i = handIndex[slot]
+            cost = weights[i] * np.abs(angles[:, i, np.newaxis] - np.asarray(levels, dtype=float)[np.newaxis])
+            cost[np.isnan(angles[:, i])] = 0
+            cost[:, np.isnan(levels)] = np.inf
+            return cost
+        joints = self.jointAngles
+        selected = {}
+        nonSelected = {}
+        for digit in hc.handDigits:
+            if digit == "thumb":
+                mcp = levelCost(("thumb", "MCP", "dfFlex"), joints)
+                ip = levelCost(("thumb", "IP", "dfFlex"), joints)
+                cms = (("thumb", "CM", "dfFlex"), ("thumb", "CM", "dfAbd"), ("thumb", "CM", "dfRot"))
+                cm = sum(levelCost(slot, self.thumbCM[:, :, i].ravel()) for i, slot in enumerate(cms))
+                cm = cm.reshape(len(angles), len(self.abductions), len(self.oppositions))
+                # a selected thumb needs an opposition
+                noOppos = np.empty((len(angles), len(self.abductions), 1))
+                noOppos.fill(np.inf)
+                cm = np.concatenate((noOppos, cm), axis=2)
+                selected[digit] = mcp[:, :, None, None, None] + ip[:, None, :, None, None] + cm[:, None, None, :, :]
+                nsfCM = sum(levelCost(slot, self.nsfThumbCM[:, i]) for i, slot in enumerate(cms))
+                nonSelected[digit] = mcp + ip + nsfCM
+            else:
+                mcp = levelCost((digit, "MCP", "dfFlex"), joints)
+                abd = levelCost((digit, "MCP", "dfAbd"), self.fingerAbduction[digit])
+                pip = levelCost((digit, "PIP", "dfFlex"), joints) + levelCost((digit, "DIP", "dfFlex"), joints)
+                selected[digit] = mcp[:, :, None, None] + pip[:, None, :, None] + abd[:, None, None, :]
+                nsfAbd = levelCost((digit, "MCP", "dfAbd"), [hs.phonoAbduction[digit][nsfAbduction(joint)] for joint in self.joints])
+                nonSelected[digit] = mcp + pip + nsfAbd
+        return selected, nonSelected
+
+    def quantize(self, angles, method="unweighted"):
+        """The codes of the fully specified handshapes closest to every frame of angles
+
+        angles is an N x hc.handSize (or hc.armSize, the wrist is ignored) array, or a single
+        frame. Every digit is selected, secondary selected or nonselected, so each frame is
+        quantized to the levels of the phonological features and its digits are grouped at the
+        same time: this is the code (among those that specify every digit) with the least
+        degrees different (see hc) from the frame. Returns the codes and the degrees different.
+        Equally close codes are resolved in favor of fewer groups, then the lowest code."""
+        angles = np.asarray(angles, dtype=float)
+        if angles.ndim == 1:
+            angles = angles[np.newaxis]
+        if angles.ndim == 2 and angles.shape[1] == hc.armSize:
+            angles = angles[:, hc.wristSize:]
+        if angles.ndim != 2 or angles.shape[1] != hc.handSize:
+            raise spaceError("Angles need to be an N x %s (or N x %s) array, got shape %s instead." % (hc.handSize, hc.armSize, str(angles.shape)))
+        selected, nonSelected = self.digitCosts(angles, hc.methodWeights(method, hc.handWeights))
+        n = len(angles)
+        thumbBit = 1 << hc.handDigits.index("thumb")
+        # the best levels for every group of (secondary) selected fingers
+        groupCost = np.empty((n, len(memberSets)))
+        groupLevel = np.zeros((n, len(memberSets)), dtype=np.int64)
+        for subset in range(1, len(memberSets)):
+            members = memberSets[subset]
+            fingers = [digit for digit in members if digit != "thumb"]
+            cost = sum(selected[digit] for digit in fingers) if fingers else 0
+            if "thumb" in members:
+                cost = (cost[..., np.newaxis] if fingers else 0) + selected["thumb"]
+            cost = cost.reshape(n, -1)
+            groupLevel[:, subset] = np.argmin(cost, axis=1)
+            groupCost[:, subset] = cost[np.arange(n), groupLevel[:, subset]]
+        # the best joints for every group of nonselected fingers (0 for no nonselected fingers)
+        restCost = np.zeros((n, len(memberSets)))
+        restLevel = np.zeros((n, len(memberSets)), dtype=np.int64)
+        for subset in range(1, len(memberSets)):
+            if not self.nonSelected:
+                restCost[:, subset] = np.inf
+                continue
+            cost = sum(nonSelected[digit] for digit in memberSets[subset])
+            restLevel[:, subset] = np.argmin(cost, axis=1) + 1
+            restCost[:, subset] = cost[np.arange(n), restLevel[:, subset]-1]
+        everything = len(memberSets) - 1
+        blockCost = np.empty((n, len(self.blocks)))
+        for block, (sf, ssf) in enumerate(self.blocks):
+            ssfBits = 0 if ssf is None else ssf
+            blockCost[:, block] = groupCost[:, sf] + (0 if ssf is None else groupCost[:, ssf]) + restCost[:, everything & ~(sf | ssfBits)]
+        blocks = np.argmin(blockCost, axis=1)
+        distances = blockCost[np.arange(n), blocks]
+        codes = np.empty(n, dtype=np.int64)
+        fingerShape = (len(self.joints), len(self.joints), len(self.abductions))
+        for block in np.unique(blocks):
+            rows = np.flatnonzero(blocks == block)
+            sf, ssf = self.blocks[block]
+            levels = []
+            oppos = np.zeros(len(rows), dtype=np.int64)
+            for group in (sf, ssf):
+                if group is None:
+                    continue
+                if group & thumbBit:
+                    groupLevels = np.unravel_index(groupLevel[rows, group], fingerShape + (1 + len(self.oppositions),))
+                    oppos = groupLevels[3]
+                    groupLevels = groupLevels[:3]
+                else:
+                    groupLevels = np.unravel_index(groupLevel[rows, group], fingerShape)
+                levels.extend(groupLevels)
+            rest = everything & ~(sf | (0 if ssf is None else ssf))
+            levels.extend([oppos, restLevel[rows, rest]])
+            codes[rows] = self.offsets[block] + np.ravel_multi_index(levels, self.blockShapes[block])
+        return codes, distances
+
+    def toHandshapes(self, angles, method="unweighted"):
+        """The hs.handshape closest to every frame of angles, see quantize()"""
+        return [self.handshape(code) for code in self.quantize(angles, method)[0]]
+
+    ##### materializing #####
+    def materialize(self, directory=spaceDir, chunkSize=2**18):
+        """Writes the targets of the whole space to directory, see handshapeTable"""
+        if not path.isdir(directory):
+            makedirs(directory)
+        angles = np.lib.format.open_memmap(path.join(directory, "angles.npy"), mode="w+", dtype=np.int16, shape=(len(self), hc.handSize))
+        valid = np.lib.format.open_memmap(path.join(directory, "valid.npy"), mode="w+", dtype=bool, shape=(len(self),))
+        for block in range(len(self.blocks)):
+            size = int(self.offsets[block+1] - self.offsets[block])
+            for start in range(0, size, chunkSize):
+                stop = min(start+chunkSize, size)
+                blockOut, blockValid = self.blockAngles(block, start, stop)
+                rows = slice(int(self.offsets[block])+start, int(self.offsets[block])+stop)
+                angles[rows] = np.where(np.isnan(blockOut), missing, blockOut)
+                valid[rows] = blockValid
+        angles.flush()
+        valid.flush()
+        del angles, valid
+        spec = self.spec()
+        np.savez(path.join(directory, "index.npz"), joints=spec["joints"], abductions=spec["abductions"], oppositions=spec["oppositions"],
+                 secondary=spec["secondary"], nonSelected=spec["nonSelected"], offsets=self.offsets)
+        return handshapeTable(directory)
+
+##### materialized tables #####
+class handshapeTable(object):
+    """A materialized handshapeSpace, memory mapped (read only) from directory
+
+    angles holds the int16 targets of every code (missing for unspecified degrees of freedom),
+    valid whether each code is a valid handshape, and space the handshapeSpace itself."""
+    def __init__(self, directory=spaceDir):
+        try:
+            index = np.load(path.join(directory, "index.npz"))
+            spec = dict((name, index[name]) for name in ("joints", "abductions", "oppositions", "secondary", "nonSelected", "offsets"))
+        except IOError:
+            raise spaceError("There is no handshape table in %s." % (directory))
+        self.space = handshapeSpace(joints=[str(joint) for joint in spec["joints"]], abductions=[str(abd) for abd in spec["abductions"]],
+                                    oppositions=[str(oppos) for oppos in spec["oppositions"]], secondary=bool(spec["secondary"]),
+                                    nonSelected=bool(spec["nonSelected"]))
+        if not np.array_equal(self.space.offsets, spec["offsets"]):
+            raise spaceError("The handshape table in %s doesn't match its index." % (directory))
+        self.angles = np.load(path.join(directory, "angles.npy"), mmap_mode="r")
+        self.valid = np.load(path.join(directory, "valid.npy"), mmap_mode="r")
+        if self.angles.shape != (len(self.space), hc.handSize) or self.valid.shape != (len(self.space),):
+            raise spaceError("The handshape table in %s doesn't match its index." % (directory))
+
+    def __len__(self):
+        return len(self.space)
+
+    def floatAngles(self, codes):
+        """The targets of codes as floats, with nan for unspecified degrees of freedom"""
+        angles = self.angles[codes].astype(float)
+        angles[angles == missing] = np.nan
+        return angles
+
+    def validCodes(self):
+        """The codes of every valid handshape"""
+        return np.flatnonzero(self.valid)
+
+    def handshape(self, code):
+        return self.space.handshape(code)
+
+    def code(self, handshape):
+        return self.space.code(handshape)
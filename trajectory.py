@@ -0,0 +1,93 @@
+"""Interpolating between arm configuration targets, for animations
+
+A trajectory is a sequence of targets (hs.arms, arm configurations or the letters of a
+fingerspelled word) and the duration of every transition between them. interpolate() samples it
+at a frame rate into an N x hc.armSize array of angles, with every frame computed at once, and
+renderTrajectory() renders the frames as a numbered image sequence (see render.renderSequence):
+
+    times, angles = trajectory.wordTrajectory("cat", 0.25)
+    trajectory.renderTrajectory(trajectory.letterArms("cat"), 0.25, "cat/%04d.png")
+"""
+import hc
+import letters
+import render
+
+import numpy as np
+
+##### Error classes #####
+class trajectoryError(Exception):
+    pass
+
+##### easing #####
+def linear(fraction):
+    return fraction
+
+def smooth(fraction):
+    """Eases in and out of every target (smoothstep)"""
+    return fraction*fraction*(3 - 2*fraction)
+
+easings = {"linear": linear, "smooth": smooth}
+
+##### interpolation #####
+def transitionDurations(durations, transitions):
+    """An array with the duration (in seconds) of every transition, from one duration for all of them or one for each"""
+    durations = np.asarray(durations, dtype=float)
+    if durations.ndim == 0:
+        durations = np.repeat(durations, transitions)
+    if durations.shape != (transitions,):
+        raise trajectoryError("There are %s transitions, but %s durations." % (transitions, durations.size))
+    if (durations <= 0).any():
+        raise trajectoryError("Durations need to be more than 0 seconds.")
+    return durations
+
+def interpolate(targets, durations, frameRate=30, easing="linear"):
+    """Samples the trajectory through targets at frameRate frames per second
+
+    targets are hs.arms or arm configurations (or an N x hc.armSize array), and durations is
+    the duration of every transition between them (or one duration for all of them). Returns the
+    time of every frame, from the first target to the last, and an array of the angles of every
+    frame. A degree of freedom that is unspecified in one of the targets of a transition stays
+    at its value in the other; unspecified in both, it stays unspecified."""
+    angles = hc.armsToArray(targets)
+    if len(angles) == 0:
+        raise trajectoryError("A trajectory needs at least one target.")
+    if frameRate <= 0:
+        raise trajectoryError("The frame rate needs to be more than 0.")
+    try:
+        ease = easings[easing] if not callable(easing) else easing
+    except KeyError:
+        raise trajectoryError("No easing named %s, the easings are: %s" % (easing, ", ".join(sorted(easings))))
+    if len(angles) == 1:
+        return np.zeros(1), angles.copy()
+    durations = transitionDurations(durations, len(angles)-1)
+    ends = np.cumsum(durations)
+    # a small tolerance so that the last target is a frame when the durations add up to whole frames
+    times = np.arange(int(np.floor(ends[-1]*frameRate + 1e-9)) + 1) / float(frameRate)
+    transition = np.minimum(np.searchsorted(ends, times, side="right"), len(durations)-1)
+    fraction = np.clip((times - (ends[transition] - durations[transition])) / durations[transition], 0, 1)
+    fraction = ease(fraction)[:, np.newaxis]
+    start = angles[transition]
+    stop = angles[transition+1]
+    start, stop = np.where(np.isnan(start), stop, start), np.where(np.isnan(stop), start, stop)
+    return times, start + fraction*(stop - start)
+
+def frames(angles):
+    """Yields the arm configuration of every frame of an array of angles (see interpolate)"""
+    for row in angles:
+        yield hc.armconfiguration.fromArray(row)
+
+##### fingerspelling #####
+def letterArms(word, orientation=None):
+    """The arm configuration targets of the letters of word"""
+    letters.ensureLetters()
+    return [letters.cachedLetterToArmTarget(letters.lettersCols["letter"][code], orientation) for code in letters.letterCodes(word)]
+
+def wordTrajectory(word, durations, frameRate=30, easing="linear", orientation=None):
+    """interpolate() through the letters of a fingerspelled word"""
+    return interpolate(letterArms(word, orientation), durations, frameRate, easing)
+
+##### rendering #####
+def renderTrajectory(targets, durations, imageOutPattern, frameRate=30, easing="linear", processes=1, progress=None, cache=None):
+    """Renders the frames of a trajectory (see interpolate) to numbered images (see render.renderSequence), returns the error (or None) for each frame"""
+    times, angles = interpolate(targets, durations, frameRate, easing)
+    return render.renderSequence(angles, imageOutPattern, processes, progress=progress, cache=cache)